@@ -1,9 +1,24 @@
-from flask import Flask, request
-from flask_cors import CORS
-from .extensions import db, migrate, jwt
-from .routes import clients, products, trucks, orders, deliveries, users, auth, schedule, whatsapp
+# Flask, the extensions and the routes are imported inside create_app so
+# that tools using only app.utils (e.g. ``python -m app.utils.batch``) do
+# not pay for them at start-up.
+
+
+def __getattr__(name):
+    # ``from app import db`` keeps working
+    if name in ("db", "migrate", "jwt"):
+        from . import extensions
+        return getattr(extensions, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def create_app():
+    from flask import Flask, request
+    from flask_cors import CORS
+    from .extensions import db, migrate, jwt
+    from .routes import clients, products, trucks, orders, deliveries, users, auth, schedule, whatsapp
+    from .utils.snapshot import track as track_snapshot
+    from .utils.versioning import track_writes
+
     app = Flask(__name__)
     app.config.from_object('config.Config')
 
@@ -25,7 +40,13 @@ def create_app():
                 "supports_credentials": True,
                 "allow_headers": ["Content-Type", "Authorization"],
                 "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-                "expose_headers": ["Content-Disposition"]
+                "expose_headers": [
+                    "Content-Disposition",
+                    "X-Scheduler-Engine",
+                    "X-Scheduler-Gap",
+                    "ETag",
+                    "Last-Modified",
+                ]
             }
         }
     )
@@ -43,6 +64,10 @@ def create_app():
         return response
 
     db.init_app(app)
+    # Committed writes bump the table versions behind the ETags and update
+    # the schedule snapshot
+    track_writes(db.session)
+    track_snapshot(db.session, schedule.schedule_snapshot)
     migrate.init_app(app, db)
     jwt.init_app(app)
 
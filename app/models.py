@@ -19,6 +19,10 @@ class Product(db.Model):
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = db.Column(db.String(50), nullable=False)
     type = db.Column(db.String(50))
+    # Planning inputs: tonnes the plant can produce per day and tonnes
+    # already in the silo. Left empty, the product is not limited.
+    daily_capacity = db.Column(db.Float, nullable=True)
+    stock = db.Column(db.Float, nullable=True)
 
 
 class Truck(db.Model):
@@ -4,6 +4,7 @@ from flask import Blueprint, request, jsonify
 from app.models import Client
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils.versioning import conditional
 
 
 
@@ -52,6 +53,7 @@ def create_client():
 
 @bp.route('', methods=['GET', 'OPTIONS'])
 @jwt_required()
+@conditional("clients")
 def get_clients():
     if request.method == 'OPTIONS':
         return '', 200
@@ -4,6 +4,7 @@ from flask import Blueprint, request, jsonify
 from app.models import db, Delivery, DeliveryHistory, DeliveryOrder, Order, Truck, User
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils.events import event_bus
 from datetime import datetime, timedelta
 from sqlalchemy import desc, func
 
@@ -210,6 +211,18 @@ def create_delivery():
 
         db.session.commit()
         logging.info(f"Delivery created with ID: {new_delivery.id}")
+        event_bus.publish(
+            "delivery.created",
+            id=str(new_delivery.id),
+            truck_id=str(new_delivery.truck_id) if new_delivery.truck_id else None,
+            external_truck_label=new_delivery.external_truck_label,
+            scheduled_date=new_delivery.scheduled_date,
+            scheduled_time=new_delivery.scheduled_time,
+            status=new_delivery.status,
+            order_quantities={
+                str(link.order_id): link.quantity for link in new_delivery.order_links
+            },
+        )
 
         # Return the created delivery with its history
         delivery_data = {
@@ -681,6 +694,22 @@ def update_delivery(delivery_id):
     # Commit all changes
     try:
         db.session.commit()
+        if status_changed:
+            event_bus.publish(
+                "delivery.status_changed", id=str(delivery.id),
+                status=delivery.status, previous_status=original_data["status"],
+                delayed=delivery.delayed,
+            )
+        if is_rescheduling:
+            event_bus.publish(
+                "delivery.rescheduled", id=str(delivery.id),
+                truck_id=str(delivery.truck_id) if delivery.truck_id else None,
+                external_truck_label=delivery.external_truck_label,
+                scheduled_date=delivery.scheduled_date,
+                scheduled_time=delivery.scheduled_time,
+            )
+        if not (status_changed or is_rescheduling):
+            event_bus.publish("delivery.updated", id=str(delivery.id))
 
         # Get the latest history for the response
         latest_history = (
@@ -805,6 +834,10 @@ def delete_delivery(delivery_id):
         db.session.delete(delivery)
         db.session.commit()
         logging.info(f"Delivery deleted with ID: {delivery.id}")
+        event_bus.publish(
+            "delivery.deleted", id=str(delivery_uuid),
+            order_ids=[str(order_id) for order_id in order_ids],
+        )
         return jsonify({"message": "Delivery deleted"}), 200
     except Exception as e:
         logging.exception("Exception occurred while deleting delivery")
@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from app.models import Order, Client, Product
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils.events import event_bus
+from app.utils.versioning import conditional
 import logging
 import uuid
 from datetime import datetime
@@ -55,6 +57,10 @@ def create_order():
         db.session.add(new_order)
         db.session.commit()
         logging.info(f"Order created with ID: {new_order.id}")
+        event_bus.publish(
+            "order.created", id=str(new_order.id), quantity=new_order.quantity,
+            status=new_order.status,
+        )
         return jsonify({"message": "Order created", "order_id": str(new_order.id)}), 201
     except Exception as e:
         logging.exception("Exception occurred while creating order")
@@ -62,6 +68,7 @@ def create_order():
 
 @bp.route('', methods=['GET', 'OPTIONS'])
 @jwt_required()
+@conditional("orders")
 def get_orders():
     if request.method == 'OPTIONS':
         return '', 200
@@ -143,6 +150,10 @@ def update_order(order_id):
         
         db.session.commit()
         logging.info(f"Order updated with ID: {order.id}")
+        event_bus.publish(
+            "order.updated", id=str(order.id), quantity=order.quantity,
+            status=order.status,
+        )
         return jsonify({"message": "Order updated"}), 200
     except Exception as e:
         logging.exception("Exception occurred while updating order")
@@ -167,6 +178,7 @@ def delete_order(order_id):
         db.session.delete(order)
         db.session.commit()
         logging.info(f"Order deleted with ID: {order.id}")
+        event_bus.publish("order.deleted", id=str(order_uuid))
         return jsonify({"message": "Order deleted"}), 200
     except Exception as e:
         logging.exception("Exception occurred while deleting order")
@@ -2,12 +2,30 @@ from flask import Blueprint, request, jsonify
 from app.models import Product
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils.versioning import conditional
 import logging
+import math
 import uuid
 
 bp = Blueprint('products', __name__, url_prefix='/products')
 bp.strict_slashes = False
 
+
+def _limit(data, field, current=None):
+    """A daily_capacity or stock in tonnes: None (no limit) or a finite
+    number not below 0. Raises ValueError otherwise."""
+    value = data.get(field, current)
+    if value is None or value == '':
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+    if not math.isfinite(value) or value < 0:
+        raise ValueError(f"{field} must be a number not below 0")
+    return value
+
+
 @bp.route('', methods=['POST', 'OPTIONS'])
 @jwt_required()
 def create_product():
@@ -19,9 +37,16 @@ def create_product():
         logging.debug(f"JWT identity: {identity}")
         data = request.get_json(force=True, silent=True)
         logging.debug(f"Received data: {data}")
+        try:
+            daily_capacity = _limit(data, 'daily_capacity')
+            stock = _limit(data, 'stock')
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
         new_product = Product(
             name=data['name'],
-            type=data.get('type')
+            type=data.get('type'),
+            daily_capacity=daily_capacity,
+            stock=stock
         )
         db.session.add(new_product)
         db.session.commit()
@@ -33,6 +58,7 @@ def create_product():
 
 @bp.route('', methods=['GET', 'OPTIONS'])
 @jwt_required()
+@conditional("products")
 def get_products():
     if request.method == 'OPTIONS':
         return '', 200
@@ -46,7 +72,9 @@ def get_products():
             result.append({
                 "id": str(product.id),
                 "name": product.name,
-                "type": product.type
+                "type": product.type,
+                "daily_capacity": product.daily_capacity,
+                "stock": product.stock
             })
         return jsonify(result), 200
     except Exception as e:
@@ -70,8 +98,15 @@ def update_product(product_id):
         if not product:
             return jsonify({"message": "Product not found"}), 404
         data = request.get_json(force=True, silent=True)
+        try:
+            daily_capacity = _limit(data, 'daily_capacity', product.daily_capacity)
+            stock = _limit(data, 'stock', product.stock)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
         product.name = data.get('name', product.name)
         product.type = data.get('type', product.type)
+        product.daily_capacity = daily_capacity
+        product.stock = stock
         db.session.commit()
         logging.info(f"Product updated with ID: {product.id}")
         return jsonify({"message": "Product updated"}), 200
@@ -1,15 +1,353 @@
-from flask import Blueprint, jsonify, current_app, send_file
-from flask_jwt_extended import jwt_required
-from app.models import Order, Truck, Delivery
-from app.utils.scheduler import optimize_schedule
-import io, pandas as pd
+from flask import (
+    Blueprint,
+    Response,
+    jsonify,
+    current_app,
+    send_file,
+    request,
+    stream_with_context,
+)
+from flask_jwt_extended import get_jwt_identity, jwt_required
+from sqlalchemy import and_, case, exists, func, insert, or_, select, union_all, update
+from sqlalchemy.orm import joinedload
+from app.extensions import db
+from app.models import (
+    Order,
+    Truck,
+    Delivery,
+    DeliveryOrder,
+    DeliveryHistory,
+    Client,
+    Product,
+)
+from app.utils.events import event_bus, sse_format
+from app.utils.export import csv_chunks, xlsx_file
+from app.utils.jobs import JobManager
+from app.utils.planner import plan_horizon, plan_schedule, process_pool
+from app.utils.scenarios import run_scenarios
+from app.utils.telemetry import PERCENTILES, load_runs, summarize_runs
+from app.utils.versioning import conditional
+from app.utils.snapshot import ScheduleSnapshot
+from app.utils.scheduler import (
+    DEFAULT_MIN_SPLIT,
+    DEFAULT_TIME_LIMIT,
+    DEFAULT_WORKERS,
+    ENGINES,
+    result_cache,
+)
+from app.utils.timetable import (
+    DEFAULT_DAY_END,
+    DEFAULT_DAY_START,
+    DEFAULT_TURNAROUND,
+    DEFAULT_WINDOW,
+    bay_capacity,
+    plan_trips,
+)
+from datetime import date, datetime
+from email.utils import parsedate_to_datetime
+import logging, math, os, uuid
+from concurrent.futures.process import BrokenProcessPool
 
 bp = Blueprint("schedule", __name__, url_prefix="/schedule")
 bp.strict_slashes = False
 
+ACTIVE_STATUSES = ["programmé", "en cours", "Programmé", "En cours"]
+# Statuses whose deliveries take their tonnes off the orders
+DEDUCTING_STATUSES = ["programmé", "en cours"]
+# Orders waiting for a truck ("Pending" is the model default, "en attente"
+# what the orders API stores)
+PENDING_STATUSES = ["Pending", "en attente"]
+
+# Planned deliveries and pending orders as shown by get_schedule; the app
+# keeps it in step with every commit (see ``snapshot.track``)
+schedule_snapshot = ScheduleSnapshot(ACTIVE_STATUSES, pending_status="en attente")
+
+
+def product_limits():
+    """Return ``{product_id: {'capacity', 'stock'}}`` for products that have
+    a daily production capacity or a silo stock set; others are unlimited.
+    """
+    return {
+        str(p.id): {"capacity": p.daily_capacity, "stock": p.stock}
+        for p in Product.query.filter(
+            (Product.daily_capacity.isnot(None)) | (Product.stock.isnot(None))
+        ).all()
+    }
+
+
+def solver_budget(params):
+    """Solver options for one planning call.
+
+    ``time_limit`` (seconds), ``workers``, ``seed`` and ``gap_limit`` come
+    from the request, else from ``SCHEDULER_*`` config, and are capped by
+    ``SCHEDULER_MAX_TIME_LIMIT`` and ``SCHEDULER_MAX_WORKERS`` so a request
+    cannot hold the server's cores for longer than allowed. Raises
+    ValueError on bad values.
+    """
+    config = current_app.config
+    max_time = config.get("SCHEDULER_MAX_TIME_LIMIT", 60)
+    max_workers = config.get("SCHEDULER_MAX_WORKERS", os.cpu_count() or 1)
+
+    def value(name, cast, default):
+        raw = params.get(name)
+        if raw is None or raw == "":
+            raw = config.get(f"SCHEDULER_{name.upper()}", default)
+        try:
+            return None if raw is None else cast(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {name}")
+
+    time_limit = value("time_limit", float, DEFAULT_TIME_LIMIT)
+    workers = value("workers", int, DEFAULT_WORKERS)
+    seed = value("seed", int, None)
+    gap_limit = value("gap_limit", float, None)
+    # NaN passes every comparison, and min(nan, max_time) is NaN
+    if not math.isfinite(time_limit) or (
+        gap_limit is not None and not math.isfinite(gap_limit)
+    ):
+        raise ValueError("time_limit and gap_limit must be finite numbers")
+    if time_limit <= 0 or workers < 0 or (gap_limit is not None and gap_limit < 0):
+        raise ValueError(
+            "time_limit must be positive, workers and gap_limit not negative"
+        )
+    return {
+        "time_limit": min(time_limit, max_time),
+        # 0 asks for the solver default, i.e. every core it is allowed
+        "workers": min(workers or max_workers, max_workers),
+        "seed": seed,
+        "gap_limit": gap_limit,
+    }
+
+
+def planning_request(params):
+    """Build the planner call for the pending orders.
+
+    ``params`` is the query string or a JSON body. ``mode`` picks the
+    planner: ``assignment`` (default, one load per truck and day),
+    ``trips`` (timed multi-trip plan) or ``horizon`` (rolling plan over
+    ``days`` days from ``start``, with optional per-day ``limits``).
+    ``engine`` (a scheduler engine or ``auto``, default ``SCHEDULER_ENGINE``)
+    tunes the assignment and horizon planners, as do ``max_splits`` (trucks
+    that may share one order, 1 = never split) and ``min_split`` (smallest
+    portion in tonnes). ``previous_job_id`` or ``previous_cache_key`` name
+    an earlier plan of these orders (see ``stored_result``): the solver
+    starts from its trucks and ``stability`` (default
+    ``SCHEDULER_STABILITY_WEIGHT``) rewards every order kept on its truck.
+    ``time_limit``, ``workers``, ``seed`` and ``gap_limit`` set the solver
+    budget (see ``solver_budget``).
+    Returns ``(planner, args, options)``; raises ValueError on bad input.
+    """
+    mode = params.get("mode", "assignment")
+    if mode not in ("assignment", "trips", "horizon"):
+        raise ValueError(f"Unknown mode {mode}")
+    config = current_app.config
+    engine = params.get("engine") or config.get("SCHEDULER_ENGINE", "cp-sat")
+    if engine not in ENGINES and engine != "auto":
+        raise ValueError(f"Unknown engine {engine}")
+    solver_options = solver_budget(params)
+    try:
+        stability_weight = int(
+            params.get("stability") or config.get("SCHEDULER_STABILITY_WEIGHT", 0)
+        )
+    except (TypeError, ValueError):
+        raise ValueError("Invalid stability")
+    if stability_weight < 0:
+        raise ValueError("stability must not be negative")
+    try:
+        max_splits = int(params.get("max_splits") or config.get("ORDER_MAX_SPLITS", 1))
+        min_split = float(
+            params.get("min_split") or config.get("ORDER_MIN_SPLIT", DEFAULT_MIN_SPLIT)
+        )
+    except (TypeError, ValueError):
+        raise ValueError("Invalid max_splits or min_split")
+    if max_splits < 1 or not math.isfinite(min_split) or min_split <= 0:
+        raise ValueError("max_splits must be at least 1 and min_split a positive number")
+
+    priorities = dict(
+        Client.query.with_entities(Client.id, Client.priority_level).all()
+    )
+    orders = [
+        {
+            "id": str(o.id),
+            "quantity": o.quantity,
+            "date": o.requested_date,
+            "time": o.requested_time.strftime("%H:%M") if o.requested_time else None,
+            "product": str(o.product_id),
+            "priority": priorities.get(o.client_id, 1),
+        }
+        for o in Order.query.filter(Order.status.in_(PENDING_STATUSES)).all()
+    ]
+    trucks = [{"id": str(t.id), "capacity": t.capacity} for t in Truck.query.all()]
+    daily_limit = config.get("DAILY_PRODUCTION_LIMIT", 800)
+    day_start = config.get("WORKDAY_START", DEFAULT_DAY_START)
+    day_end = config.get("WORKDAY_END", DEFAULT_DAY_END)
+    bays = config.get("LOADING_BAYS")
+    bay_rate = config.get("LOADING_BAY_RATE")  # tonnes per hour per bay
+    products = product_limits()
+
+    if mode == "trips":
+        options = {
+            "allow_unassigned": True,
+            "turnaround": config.get("TRIP_TURNAROUND_MINUTES", DEFAULT_TURNAROUND),
+            "window": config.get("TRIP_WINDOW_MINUTES", DEFAULT_WINDOW),
+            "day_start": day_start,
+            "day_end": day_end,
+            "bays": bays,
+            "bay_rate": bay_rate,
+            "products": products,
+            **solver_options,
+        }
+        return plan_trips, (orders, trucks, daily_limit), options
+
+    # Without time slots the bays still cap what can leave the plant in a day
+    throughput = bay_capacity(bays, bay_rate, day_start, day_end)
+    if throughput is not None:
+        daily_limit = min(daily_limit, throughput)
+
+    options = {
+        "allow_unassigned": True,
+        "previous": previous_plan(params, orders, trucks),
+        "stability_weight": stability_weight,
+        "engine": engine,
+        "products": products,
+        "max_splits": max_splits,
+        "min_split": min_split,
+        "max_workers": config.get("PLANNER_WORKERS"),
+        "pool": planner_pool(),
+        **solver_options,
+    }
+
+    if mode == "horizon":
+        try:
+            start = date.fromisoformat(params.get("start") or date.today().isoformat())
+        except (TypeError, ValueError):
+            raise ValueError("Invalid start date, should be YYYY-MM-DD")
+        limits = params.get("limits")
+        if isinstance(limits, dict):
+            daily_limit = {"default": daily_limit, **horizon_limits(limits)}
+            # Every day stays within what the bays can load
+            if throughput is not None:
+                daily_limit = {
+                    day: min(limit, throughput) for day, limit in daily_limit.items()
+                }
+        options["start"] = start
+        try:
+            options["days"] = int(
+                params.get("days") or config.get("PLANNING_HORIZON_DAYS", 7)
+            )
+        except (TypeError, ValueError):
+            raise ValueError("Invalid days")
+        if options["days"] < 1:
+            raise ValueError("days must be at least 1")
+        return plan_horizon, (orders, trucks, daily_limit), options
+
+    return plan_schedule, (orders, trucks, daily_limit), options
+
+
+def horizon_limits(limits):
+    """Validated per-day production limits: ``{"YYYY-MM-DD" or "default":
+    tonnes}``. Raises ValueError on bad days or limits."""
+    checked = {}
+    for day, limit in limits.items():
+        if day != "default":
+            try:
+                day = date.fromisoformat(str(day)).isoformat()
+            except ValueError:
+                raise ValueError(f"Invalid day {day} in limits, should be YYYY-MM-DD")
+        try:
+            limit = float(limit)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid limit for {day}")
+        if not math.isfinite(limit) or limit < 0:
+            raise ValueError(f"Invalid limit for {day}")
+        checked[day] = limit
+    return checked
+
+
+def previous_plan(params, orders, trucks):
+    """``{order_id: truck_id}`` of the stored plan named by
+    ``previous_job_id`` or ``previous_cache_key``, limited to the orders and
+    trucks being planned; None without one. Raises ValueError when the plan
+    cannot be found or is not finished."""
+    job_id = params.get("previous_job_id")
+    cache_key = params.get("previous_cache_key")
+    if not (job_id or cache_key):
+        return None
+    try:
+        result = stored_result(job_id, cache_key)
+    except LookupError as e:
+        raise ValueError(f"Previous plan: {e}")
+    order_ids = {o["id"] for o in orders}
+    truck_ids = {t["id"] for t in trucks}
+    return {
+        str(order_id): str(entry["truck"])
+        for entry in result.get("schedule") or []
+        if str(entry["truck"]) in truck_ids
+        for order_id in entry.get("orders") or []
+        if str(order_id) in order_ids
+    }
+
+
+def job_manager():
+    """The app's optimization job pool, created on first use."""
+    if "schedule_jobs" not in current_app.extensions:
+        current_app.extensions["schedule_jobs"] = JobManager(
+            current_app.config.get("SCHEDULE_JOB_WORKERS", 2)
+        )
+    return current_app.extensions["schedule_jobs"]
+
+
+def planner_pool():
+    """The app's solver process pool, created on first use and shared by
+    every request rather than started for each one."""
+    if "schedule_processes" not in current_app.extensions:
+        current_app.extensions["schedule_processes"] = process_pool(
+            current_app.config.get("PLANNER_WORKERS")
+        )
+    return current_app.extensions["schedule_processes"]
+
+
+def run_in_pool(planner, *args, **options):
+    """Call ``planner``; if a worker of its ``pool`` died (out of memory, a
+    crash), which breaks the pool for good, replace the app's pool and
+    retry once."""
+    try:
+        return planner(*args, **options)
+    except BrokenProcessPool:
+        broken = options.get("pool")
+        if broken is None:
+            raise
+        logging.warning("Solver process pool broke, starting a new one")
+        # Another request may already have replaced it
+        if current_app.extensions.get("schedule_processes") is broken:
+            del current_app.extensions["schedule_processes"]
+        broken.shutdown(wait=False)
+        return planner(*args, **dict(options, pool=planner_pool()))
+
+
+def stored_result(job_id=None, cache_key=None):
+    """The result of the finished job ``job_id``, or the cached result under
+    ``cache_key``.
+
+    Raises LookupError when there is no such job or entry and ValueError
+    when the job has no result yet.
+    """
+    if job_id:
+        job = job_manager().get(job_id)
+        if not job:
+            raise LookupError("Job not found")
+        if job.result is None:
+            raise ValueError("Job has no result yet")
+        return job.result
+    result = result_cache.get(cache_key)
+    if result is None:
+        raise LookupError("No cached result under this key")
+    return result
+
 
 @bp.route("/deliveries", methods=["GET"])
 @jwt_required()
+@conditional("trucks", "deliveries", "delivery_orders", "orders")
 def get_schedule():
     """Return the current delivery schedule.
 
@@ -19,166 +357,674 @@ def get_schedule():
     the frontend can notify the user.
     """
 
-    active_statuses = ["programmé", "en cours", "Programmé", "En cours"]
+    # The snapshot is built on first use, then kept up to date by every
+    # commit, so this reads no table
+    if not schedule_snapshot.built:
+        schedule_snapshot.rebuild(db.session.connection())
+    schedule_snapshot.start_checker(
+        current_app._get_current_object(), db.session,
+        current_app.config.get("SCHEDULE_SNAPSHOT_CHECK_SECONDS", 300),
+    )
+    schedule, totals = schedule_snapshot.schedule()
+
+    daily_limit = current_app.config.get("DAILY_PRODUCTION_LIMIT", 800)
+
+    stats = {
+        "total_pending_orders": totals["scheduled_orders"] + totals["pending_orders"],
+        "total_pending_quantity": totals["scheduled_quantity"] + totals["pending_quantity"],
+        "total_trucks": totals["total_trucks"],
+        "total_capacity": totals["total_capacity"],
+        "daily_limit": daily_limit,
+        "scheduled_orders": totals["scheduled_orders"],
+        "scheduled_quantity": totals["scheduled_quantity"],
+        "trucks_utilized": len([s for s in schedule if s["orders"] and not s.get("is_external", False)]),  # Only count company trucks with orders
+    }
+
+    return jsonify({"schedule": schedule, "stats": stats}), 200
+
+
+@bp.route("/snapshot/check", methods=["POST"])
+@jwt_required()
+def check_schedule_snapshot():
+    """Rebuild the schedule snapshot from the tables and report any drift
+    (ids whose maintained values differed from the rebuilt ones)."""
+    return jsonify(schedule_snapshot.check(db.session.connection())), 200
+
+
+def export_row(row, quantity, day, at, truck):
+    """One export line; ``row`` carries the client and product columns."""
+    return {
+        "Client": row.client_name or str(row.client_id),
+        "Quantité (t)": quantity,
+        "Produit": (
+            f"{row.product_name} ({row.product_type})" if row.product_type
+            else (row.product_name or "")
+        ),
+        "Date": day.strftime("%Y-%m-%d") if day else "",
+        "Heure": at.strftime("%H:%M") if at else "",
+        "Camion": truck,
+    }
 
-    # All trucks (to keep empty ones in the result)
-    trucks = Truck.query.all()
 
-    # Deliveries that are currently planned
-    deliveries = Delivery.query.filter(Delivery.status.in_(active_statuses)).all()
+def plan_rows(result, chunk_size=None):
+    """Export rows of a planner result in plan order: one per trip, at its
+    ``scheduled_date``/``scheduled_time``, for timed plans; otherwise one
+    per order on a truck, on the order's requested day and time.
 
-    # Map truck_id -> schedule item
-    # Each order entry will include the quantity scheduled for that delivery
-    schedule_map = {
-        t.id: {
-            "truck": t.plate_number, 
-            "orders": [], 
-            "load": 0,
-            "is_external": False  # Company trucks
-        } for t in trucks
+    Orders are read with their client and product by one joined query per
+    ``chunk_size`` (``EXPORT_CHUNK_SIZE``) rows, as plain columns, so memory
+    holds a chunk rather than every order, client and product.
+    """
+    chunk_size = chunk_size or current_app.config.get("EXPORT_CHUNK_SIZE", 500)
+    plates = {
+        str(truck_id): plate
+        for truck_id, plate in Truck.query.with_entities(Truck.id, Truck.plate_number)
     }
 
-    scheduled_order_ids = set()
-    scheduled_quantity = 0.0
-
-    for d in deliveries:
-        entry = schedule_map.get(d.truck_id)
-        if not entry:
-            if d.is_external:
-                key = f"ext:{d.external_truck_label or 'Externe'}"
-                entry = schedule_map.setdefault(
-                    key,
-                    {
-                        "truck": d.external_truck_label or "Externe",
-                        "orders": [],
-                        "load": 0,
-                        "is_external": True,  # External trucks
-                    },
+    def lines():
+        """``(order_id, tonnes, day, time, truck)``; None fields come from
+        the order."""
+        if result.get("trips"):
+            for trip in result["trips"]:
+                at = trip.get("scheduled_time")
+                yield (
+                    str(trip["order"]), trip.get("quantity"),
+                    _plan_date(trip.get("scheduled_date")),
+                    datetime.strptime(at[:5], "%H:%M").time() if at else None,
+                    str(trip["truck"]),
+                )
+            return
+        for sch in result["schedule"]:
+            for order_id in sch["orders"]:
+                yield (
+                    order_id, sch.get("order_quantities", {}).get(order_id),
+                    None, None, str(sch["truck"]),
                 )
-            else:
+
+    def rows(chunk):
+        ids = []
+        for order_id, *rest in chunk:
+            try:
+                ids.append(uuid.UUID(order_id))
+            except ValueError:
+                continue
+        details = {
+            str(row.id): row
+            for row in db.session.query(
+                Order.id, Order.client_id, Order.quantity, Order.requested_date,
+                Order.requested_time, Client.name.label("client_name"),
+                Product.name.label("product_name"), Product.type.label("product_type"),
+            )
+            .outerjoin(Client, Client.id == Order.client_id)
+            .outerjoin(Product, Product.id == Order.product_id)
+            .filter(Order.id.in_(ids))
+        }
+        for order_id, quantity, day, at, truck in chunk:
+            row = details.get(order_id)
+            if row is None:
                 continue
+            yield export_row(
+                row,
+                row.quantity if quantity is None else quantity,
+                day or row.requested_date,
+                at if day else row.requested_time,
+                plates.get(truck, truck),
+            )
+
+    chunk = []
+    for line in lines():
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield from rows(chunk)
+            chunk = []
+    yield from rows(chunk)
 
-        # Collect orders associated with this delivery with quantities
-        links = d.order_links
-        legacy_handled = False
-        for link in links:
-            entry["orders"].append(
-                {"id": str(link.order_id), "quantity": link.quantity}
+
+def committed_rows(chunk_size=None):
+    """Export rows of the committed schedule, as ``/schedule/deliveries``
+    shows it: one per order on an active delivery, by date, time and truck.
+
+    Deliveries, their orders, trucks, clients and products come from one
+    joined query whose rows are fetched ``chunk_size``
+    (``EXPORT_CHUNK_SIZE``) at a time. A legacy ``order_id`` not also in
+    the delivery's ``order_links`` counts with its order's quantity.
+    """
+    chunk_size = chunk_size or current_app.config.get("EXPORT_CHUNK_SIZE", 500)
+
+    def lines(quantity, order_id):
+        return (
+            select(
+                Delivery.scheduled_date, Delivery.scheduled_time,
+                Delivery.external_truck_label, Truck.plate_number,
+                Order.client_id, Client.name.label("client_name"),
+                Product.name.label("product_name"),
+                Product.type.label("product_type"), quantity.label("quantity"),
+            )
+            .select_from(Delivery)
+            .join(Order, Order.id == order_id)
+            .outerjoin(Truck, Truck.id == Delivery.truck_id)
+            .outerjoin(Client, Client.id == Order.client_id)
+            .outerjoin(Product, Product.id == Order.product_id)
+            .where(
+                Delivery.status.in_(ACTIVE_STATUSES),
+                # Same deliveries as the snapshot: an existing company truck
+                # or an external one
+                or_(
+                    Truck.id.isnot(None),
+                    and_(Delivery.truck_id.is_(None), Delivery.is_external),
+                ),
             )
-            scheduled_order_ids.add(link.order_id)
-            scheduled_quantity += link.quantity
-            if d.order_id and link.order_id == d.order_id:
-                legacy_handled = True
-
-        # Handle legacy single order_id if not already represented in order_links
-        if d.order_id and not legacy_handled:
-            order = Order.query.get(d.order_id)
-            qty = order.quantity if order else 0
-            entry["orders"].append({"id": str(d.order_id), "quantity": qty})
-            scheduled_order_ids.add(d.order_id)
-            scheduled_quantity += qty
-
-    # Convert schedule map to list (keep truck order from DB)
-    schedule = list(schedule_map.values())
-
-    # Orders that are not yet planned
-    pending_orders = Order.query.filter_by(status="en attente").all()
-    pending_quantity = sum(o.quantity for o in pending_orders)
+        )
 
-    daily_limit = current_app.config.get("DAILY_PRODUCTION_LIMIT", 800)
-    total_capacity = sum(t.capacity for t in trucks)
+    linked = lines(DeliveryOrder.quantity, DeliveryOrder.order_id).join(
+        DeliveryOrder, DeliveryOrder.delivery_id == Delivery.id
+    )
+    legacy = lines(Order.quantity, Delivery.order_id).where(
+        ~exists().where(
+            DeliveryOrder.delivery_id == Delivery.id,
+            DeliveryOrder.order_id == Delivery.order_id,
+        )
+    )
+    combined = union_all(linked, legacy).subquery()
+    query = select(combined).order_by(
+        combined.c.scheduled_date, combined.c.scheduled_time,
+        combined.c.plate_number, combined.c.external_truck_label,
+    )
 
-    stats = {
-        "total_pending_orders": len(scheduled_order_ids) + len(pending_orders),
-        "total_pending_quantity": scheduled_quantity + pending_quantity,
-        "total_trucks": len(trucks),
-        "total_capacity": total_capacity,
-        "daily_limit": daily_limit,
-        "scheduled_orders": len(scheduled_order_ids),
-        "scheduled_quantity": scheduled_quantity,
-        "trucks_utilized": len([s for s in schedule if s["orders"] and not s.get("is_external", False)]),  # Only count company trucks with orders
-    }
+    for row in db.session.execute(query.execution_options(yield_per=chunk_size)):
+        yield export_row(
+            row, row.quantity, row.scheduled_date, row.scheduled_time,
+            row.plate_number or row.external_truck_label or "Externe",
+        )
 
-    return jsonify({"schedule": schedule, "stats": stats}), 200
+
+def export_response(rows, name, result=None):
+    """Send export rows as ``format=csv`` (streamed in chunks as they are
+    produced) or as an Excel workbook (default)."""
+    if request.args.get("format") == "csv":
+        response = Response(
+            stream_with_context(csv_chunks(rows)),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={name}.csv"},
+        )
+    else:
+        response = send_file(
+            xlsx_file(rows, "Planning"),
+            as_attachment=True,
+            download_name=f"{name}.xlsx",
+            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+    if result is not None:
+        # Tell the client which engine produced the plan and how far the
+        # greedy seed was from the final objective
+        response.headers["X-Scheduler-Engine"] = result["engine"]
+        if result.get("gap") is not None:
+            response.headers["X-Scheduler-Gap"] = f"{result['gap']:.4f}"
+    return response
 
 
 @bp.route("/export", methods=["GET"])
 @jwt_required()
 def export_schedule():
-    from app.models import Order, Truck, Client, Product  # Import here if needed
-    import pandas as pd, io
+    """Download a schedule as ``format=xlsx`` (default) or ``csv``, which is
+    streamed as it is written.
 
-    # Fetch all needed data
-    orders = {str(o.id): o for o in Order.query.all()}
-    trucks = {str(t.id): t for t in Truck.query.all()}
-    clients = {str(c.id): c for c in Client.query.all()}
-    products = {str(p.id): p for p in Product.query.all()}
+    ``source=committed`` exports the deliveries already planned, exactly as
+    ``/schedule/deliveries`` shows them, without running the optimizer.
+    ``job_id`` (a finished job) or ``cache_key`` (a result's ``cache_key``)
+    exports that stored result. Otherwise the pending orders are optimized
+    with the planning options of ``planning_request``.
+    """
+    if request.args.get("source") == "committed":
+        return export_response(committed_rows(), "livraisons_programmees")
 
-    # Regenerate the schedule (same as the planning)
-    daily_limit = current_app.config.get("DAILY_PRODUCTION_LIMIT", 800)
-    # Use pending orders only (or all, as needed)
-    schedule_result = optimize_schedule(
-        [
+    if request.args.get("job_id") or request.args.get("cache_key"):
+        try:
+            result = stored_result(
+                request.args.get("job_id"), request.args.get("cache_key")
+            )
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 409
+    else:
+        # Regenerate the schedule (same as the planning)
+        try:
+            planner, args, options = planning_request(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        result = run_in_pool(planner, *args, **options)
+
+    return export_response(plan_rows(result), "planning_livraisons", result)
+
+
+@bp.route("/jobs", methods=["POST"])
+@jwt_required()
+def create_job():
+    """Start an optimization of the pending orders in the background.
+
+    Accepts the same options as the export (``mode``, ``engine``,
+    ``previous_job_id``, ...) and returns the job id to poll. ``mode=trips``
+    results carry the timed ``trips`` with their
+    ``scheduled_date``/``scheduled_time``.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        planner, args, options = planning_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job = job_manager().submit(planner, *args, **options)
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def get_job(job_id):
+    """Report a job's status, incumbent objective and bound (and its result
+    once finished)."""
+    job = job_manager().get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict(include_result=job.finished)), 200
+
+
+@bp.route("/jobs/<job_id>", methods=["DELETE"])
+@jwt_required()
+def cancel_job(job_id):
+    """Cancel a queued or running job; the best plan so far is kept."""
+    job = job_manager().cancel(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"job_id": job.id, "status": job.status, "cancelled": job.cancelled}), 200
+
+
+@bp.route("/scenarios", methods=["POST"])
+@jwt_required()
+def compare_scenarios():
+    """Plan the pending orders under several what-if variants at once.
+
+    The body takes the export's planning options plus ``scenarios``, a list
+    of changes to trucks, limit and orders (see ``apply_delta``), e.g.
+    ``{"name": "T12 down", "remove_trucks": ["<id>"]}`` or
+    ``{"daily_limit": 900}``. The variants are solved concurrently and the
+    response is a comparison table with the base plan first; ``details``
+    adds each variant's full plan.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    deltas = data.get("scenarios")
+    if not isinstance(deltas, list) or not all(isinstance(d, dict) for d in deltas):
+        return jsonify({"error": "scenarios must be a list of objects"}), 400
+    limit = current_app.config.get("SCENARIO_MAX", 20)
+    if len(deltas) > limit:
+        return jsonify({"error": f"At most {limit} scenarios per request"}), 400
+    if data.get("mode", "assignment") != "assignment":
+        return jsonify({"error": "Scenarios compare assignment plans only"}), 400
+
+    try:
+        planner, args, options = planning_request(data)
+        options.pop("max_workers", None)
+        table = run_in_pool(
+            run_scenarios, *args, deltas,
+            max_workers=current_app.config.get("SCENARIO_WORKERS"),
+            pool=options.pop("pool"),
+            details=bool(data.get("details")),
+            **options,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(table), 200
+
+
+@bp.route("/cache", methods=["GET"])
+@jwt_required()
+def get_cache_stats():
+    """Hit/miss counters and size of the solver result cache."""
+    return jsonify(result_cache.stats()), 200
+
+
+def _plan_date(value):
+    """A plan's date as a ``date``: plans hold ``date`` objects, ISO strings
+    or, once through ``jsonify``, HTTP dates."""
+    if value is None or isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        try:
+            return parsedate_to_datetime(str(value)).date()
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid date {value}")
+
+
+def plan_deliveries(result, scheduled_date=None):
+    """Turn a planner result into the deliveries to create.
+
+    Timed plans (with ``trips``) give one delivery per trip at its
+    ``scheduled_time``; assignment plans one delivery per schedule entry
+    with orders, on the entry's ``date`` or else ``scheduled_date``, which
+    also replaces dates already past (overdue orders' requested days). An
+    entry with ``is_external`` is booked on a hired truck labelled
+    ``external_truck_label`` (default: its ``truck``).
+
+    Returns dicts {'truck', 'is_external', 'label', 'date', 'time',
+    'quantities'} where ``quantities`` maps order id -> tonnes (None for
+    the whole order). Raises ValueError on malformed entries.
+    """
+    deliveries = []
+    scheduled_date = _plan_date(scheduled_date)
+    try:
+        if result.get("trips"):
+            entries = [
+                dict(trip, order_quantities={trip["order"]: trip.get("quantity")},
+                     date=trip.get("scheduled_date"))
+                for trip in result["trips"]
+            ]
+        else:
+            entries = [e for e in result.get("schedule") or [] if e.get("orders")]
+        for entry in entries:
+            quantities = entry.get("order_quantities") or {
+                order_id: None for order_id in entry["orders"]
+            }
+            time = entry.get("scheduled_time")
+            day = _plan_date(entry.get("date")) or scheduled_date
+            if scheduled_date and day < date.today():
+                day = scheduled_date
+            deliveries.append({
+                "truck": str(entry["truck"]),
+                "is_external": bool(entry.get("is_external")),
+                "label": entry.get("external_truck_label") or str(entry["truck"]),
+                "date": day,
+                "time": datetime.strptime(time[:5], "%H:%M").time() if time else None,
+                "quantities": {
+                    uuid.UUID(str(order_id)): None if qty is None else float(qty)
+                    for order_id, qty in quantities.items()
+                },
+            })
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid plan entry: {e}")
+    return deliveries
+
+
+def commit_plan(deliveries, status, user_id):
+    """Create the deliveries of a plan in one transaction.
+
+    Applies ``create_delivery``'s checks to the whole plan with one query
+    per table: orders exist and are not already on a delivery, no order is
+    planned beyond its remaining quantity, trucks exist, are booked once
+    per date and time (counting the plan's own deliveries) and are not
+    overloaded, and every delivery is after now (a date without a time
+    counts as midnight). Rows are then bulk inserted and the quantities deducted with
+    a single UPDATE. Returns the new delivery ids; raises ValueError (with
+    nothing written) when a check fails.
+    """
+    order_ids = {oid for d in deliveries for oid in d["quantities"]}
+    orders = {
+        o.id: o
+        for o in Order.query.options(joinedload(Order.client))
+        .filter(Order.id.in_(order_ids)).all()
+    }
+    missing = order_ids - set(orders)
+    if missing:
+        raise ValueError(f"Orders not found: {', '.join(sorted(map(str, missing)))}")
+
+    scheduled = {
+        row[0] for row in db.session.query(DeliveryOrder.order_id)
+        .filter(DeliveryOrder.order_id.in_(order_ids)).distinct()
+    } | {
+        row[0] for row in db.session.query(Delivery.order_id)
+        .filter(Delivery.order_id.in_(order_ids)).distinct()
+    }
+    if scheduled:
+        raise ValueError(
+            f"Orders already scheduled: {', '.join(sorted(map(str, scheduled)))}"
+        )
+
+    # Whole orders are taken as they stand; split ones add up their portions
+    planned = {}
+    for delivery in deliveries:
+        for oid, qty in delivery["quantities"].items():
+            if qty is None:
+                qty = delivery["quantities"][oid] = orders[oid].quantity
+            if qty <= 0:
+                raise ValueError(f"Invalid quantity for order {oid}")
+            planned[oid] = planned.get(oid, 0) + qty
+    for oid, qty in planned.items():
+        if qty > orders[oid].quantity + 1e-6:
+            raise ValueError(f"Quantity {qty} exceeds remaining for order {oid}")
+
+    truck_ids = set()
+    for delivery in deliveries:
+        if not delivery["is_external"]:
+            try:
+                delivery["truck_id"] = uuid.UUID(delivery["truck"])
+            except ValueError:
+                raise ValueError(f"Invalid truck_id {delivery['truck']}")
+            truck_ids.add(delivery["truck_id"])
+    trucks = {t.id: t for t in Truck.query.filter(Truck.id.in_(truck_ids)).all()}
+    if truck_ids - set(trucks):
+        raise ValueError(
+            f"Trucks not found: {', '.join(sorted(map(str, truck_ids - set(trucks))))}"
+        )
+
+    now = datetime.now()
+    overdue = {
+        oid for d in deliveries if d["date"] is not None
+        and datetime.combine(d["date"], d["time"] or datetime.min.time()) <= now
+        for oid in d["quantities"]
+    }
+    if overdue:
+        raise ValueError(
+            "Delivery must be in the future; give a scheduled_date for orders "
+            f"{', '.join(sorted(map(str, overdue)))}"
+        )
+
+    booked = {
+        tuple(row) for row in db.session.query(
+            Delivery.truck_id, Delivery.scheduled_date, Delivery.scheduled_time
+        ).filter(
+            Delivery.truck_id.in_(truck_ids),
+            Delivery.scheduled_date.in_({d["date"] for d in deliveries}),
+        )
+    }
+    for delivery in deliveries:
+        if delivery["is_external"]:
+            continue
+        truck = trucks[delivery["truck_id"]]
+        slot = (truck.id, delivery["date"], delivery["time"])
+        if slot in booked:
+            raise ValueError(f"Truck {truck.plate_number} already booked for this time")
+        # Two deliveries of this plan cannot share a slot either
+        booked.add(slot)
+        if truck.capacity and sum(delivery["quantities"].values()) > truck.capacity + 1e-6:
+            raise ValueError(f"Truck {truck.plate_number} capacity exceeded")
+
+    deducted = status in DEDUCTING_STATUSES
+    delivery_rows, link_rows, history_rows = [], [], []
+    for delivery in deliveries:
+        delivery_id = uuid.uuid4()
+        delivery_rows.append({
+            "id": delivery_id,
+            "truck_id": delivery.get("truck_id"),
+            "external_truck_label": delivery["label"] if delivery["is_external"] else None,
+            "is_external": delivery["is_external"],
+            "scheduled_date": delivery["date"],
+            "scheduled_time": delivery["time"],
+            "status": status,
+            "destination": (
+                orders[next(iter(delivery["quantities"]))].client.address or ""
+            ),
+            "notes": "",
+            "delayed": False,
+        })
+        history_rows.append({
+            "id": uuid.uuid4(),
+            "delivery_id": delivery_id,
+            "status": status,
+            "changed_by": user_id,
+            "notes": "Initial status",
+            "change_type": "status_change",
+        })
+        link_rows.extend(
             {
-                "id": str(o.id),
-                "quantity": o.quantity,
-                "priority": (
-                    clients[str(o.client_id)].priority_level
-                    if str(o.client_id) in clients
-                    else 1
-                ),
+                "delivery_id": delivery_id,
+                "order_id": oid,
+                "quantity": qty,
+                "quantity_deducted": deducted,
             }
-            for o in Order.query.filter_by(status="Pending").all()
-        ],
-        [{"id": str(t.id), "capacity": t.capacity} for t in Truck.query.all()],
-        daily_limit,
-    )
+            for oid, qty in delivery["quantities"].items()
+        )
 
-    # Build Excel rows: one per assignment
-    rows = []
-    for sch in schedule_result:
-        truck = trucks.get(sch["truck"])
-        truck_plate = truck.plate_number if truck else sch["truck"]
-        for idx, order_id in enumerate(sch["orders"], 1):
-            order = orders.get(order_id)
-            if not order:
-                continue
-            client = clients.get(str(order.client_id))
-            product = products.get(str(order.product_id))
-
-            rows.append(
-                {
-                    "Client": client.name if client else str(order.client_id),
-                    "Quantité (t)": order.quantity,
-                    "Produit": (
-                        f"{product.name} ({product.type})"
-                        if product and product.type
-                        else (product.name if product else "")
-                    ),
-                    "Date": (
-                        order.requested_date.strftime("%Y-%m-%d")
-                        if order.requested_date
-                        else ""
+    try:
+        db.session.execute(insert(Delivery), delivery_rows)
+        db.session.execute(insert(DeliveryOrder), link_rows)
+        db.session.execute(insert(DeliveryHistory), history_rows)
+        if deducted:
+            db.session.execute(
+                update(Order)
+                .where(Order.id.in_(planned))
+                .values(
+                    quantity=Order.quantity - case(planned, value=Order.id, else_=0),
+                    status=case(
+                        (func.lower(Order.status) == "en attente", "planifié"),
+                        else_=Order.status,
                     ),
-                    "Heure": (
-                        order.requested_time.strftime("%H:%M")
-                        if order.requested_time
-                        else ""
-                    ),
-                    "Camion": truck_plate,
-                }
+                )
+                .execution_options(synchronize_session=False)
             )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    event_bus.publish(
+        "plan.committed",
+        deliveries=[
+            {
+                "id": str(row["id"]),
+                "truck_id": str(row["truck_id"]) if row["truck_id"] else None,
+                "scheduled_date": row["scheduled_date"],
+                "scheduled_time": row["scheduled_time"],
+            }
+            for row in delivery_rows
+        ],
+        order_quantities={str(oid): qty for oid, qty in planned.items()},
+        status=status,
+    )
+    return [row["id"] for row in delivery_rows]
+
+
+@bp.route("/telemetry", methods=["GET"])
+@jwt_required()
+def get_solver_telemetry():
+    """Percentile summary of recorded solver runs, per engine.
+
+    ``engine`` and ``since`` ("YYYY-MM-DD[THH:MM:SS]") filter the runs;
+    at most the latest ``SOLVER_TELEMETRY_WINDOW`` runs are summarised.
+    ``recent`` adds that many of the latest runs themselves.
+    """
+    try:
+        recent = int(request.args.get("recent") or 0)
+    except ValueError:
+        return jsonify({"error": "Invalid recent"}), 400
+    runs = load_runs(
+        engine=request.args.get("engine"),
+        since=request.args.get("since"),
+        limit=current_app.config.get("SOLVER_TELEMETRY_WINDOW", 10000),
+    )
+    data = {
+        "runs": len(runs),
+        "percentiles": list(PERCENTILES),
+        "engines": summarize_runs(runs),
+    }
+    if recent > 0:
+        data["recent"] = runs[-recent:]
+    return jsonify(data), 200
+
+
+@bp.route("/commit", methods=["POST"])
+@jwt_required()
+def commit_schedule():
+    """Create the deliveries of an optimized plan in one transaction.
+
+    The body is a planner result (``schedule`` and optionally ``trips``, as
+    returned by a job or the what-if ``details``), either inline, under
+    ``result``, or by ``job_id`` of a finished job. ``status`` (default
+    ``programmé``) applies to every delivery and ``scheduled_date`` to
+    entries without a ``date`` or with one already past. Nothing is
+    written if any delivery fails ``create_delivery``'s checks.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    if data.get("job_id"):
+        try:
+            result = stored_result(data["job_id"])
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 409
+    else:
+        result = data.get("result") or data
+    if not isinstance(result, dict):
+        return jsonify({"error": "result must be an object"}), 400
+
+    try:
+        user_id = uuid.UUID(str(get_jwt_identity()))
+    except ValueError:
+        return jsonify({"error": "Invalid user ID format"}), 400
+    status = (data.get("status") or "programmé").lower()
+
+    try:
+        deliveries = plan_deliveries(result, data.get("scheduled_date"))
+        if not deliveries:
+            return jsonify({"error": "The plan has no deliveries"}), 400
+        delivery_ids = commit_plan(deliveries, status, user_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "message": "Plan committed",
+        "deliveries": [str(delivery_id) for delivery_id in delivery_ids],
+        "orders": len({oid for d in deliveries for oid in d["quantities"]}),
+    }), 201
+
+
+@bp.route("/events", methods=["GET"])
+@jwt_required(locations=["headers", "query_string"])
+def stream_events():
+    """Server-Sent Events stream of delivery, order, truck and plan changes.
+
+    Each message is ``event: <type>`` (``delivery.created``,
+    ``delivery.status_changed``, ``delivery.rescheduled``,
+    ``delivery.deleted``, ``plan.committed``, ``order.*``, ``truck.*``)
+    with a small JSON payload. A client resuming with ``Last-Event-ID``
+    (or ``?last_event_id=``) first gets what it missed; when that is no
+    longer known it gets a ``resync`` event and should reload the schedule.
+    ``EventSource`` cannot send headers, so the token may be passed as
+    ``?jwt=``.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+        "last_event_id"
+    )
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    keepalive = current_app.config.get("EVENT_STREAM_KEEPALIVE", 15)
+    subscription = event_bus.subscribe(last_event_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                if subscription.resync:
+                    subscription.resync = False
+                    yield "event: resync\ndata: {}\n\n"
+                event = subscription.get(timeout=keepalive)
+                # A comment line keeps proxies from closing an idle stream
+                yield sse_format(event) if event else ": keep-alive\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
 
-    # Make DataFrame & export to Excel
-    df = pd.DataFrame(rows)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        df.to_excel(writer, index=False, sheet_name="Planning")
-    output.seek(0)
-
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name="planning_livraisons.xlsx",
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -4,6 +4,8 @@ from flask import Blueprint, request, jsonify
 from app.models import Truck
 from app.extensions import db
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.utils.events import event_bus
+from app.utils.versioning import conditional
 
 bp = Blueprint('trucks', __name__, url_prefix='/trucks')
 bp.strict_slashes = False
@@ -27,6 +29,10 @@ def create_truck():
         db.session.add(new_truck)
         db.session.commit()
         logging.info(f"Truck created with ID: {new_truck.id}")
+        event_bus.publish(
+            "truck.created", id=str(new_truck.id), plate_number=new_truck.plate_number,
+            capacity=new_truck.capacity,
+        )
         return jsonify({"message": "Truck created", "truck_id": str(new_truck.id)}), 201
     except Exception as e:
         logging.exception("Exception occurred while creating truck")
@@ -34,6 +40,7 @@ def create_truck():
 
 @bp.route('', methods=['GET', 'OPTIONS'])
 @jwt_required()
+@conditional("trucks")
 def get_trucks():
     if request.method == 'OPTIONS':
         return '', 200
@@ -77,6 +84,10 @@ def update_truck(truck_id):
         truck.driver_name = data.get('driver_name', truck.driver_name)
         db.session.commit()
         logging.info(f"Truck updated with ID: {truck.id}")
+        event_bus.publish(
+            "truck.updated", id=str(truck.id), plate_number=truck.plate_number,
+            capacity=truck.capacity,
+        )
         return jsonify({"message": "Truck updated"}), 200
     except Exception as e:
         logging.exception("Exception occurred while updating truck")
@@ -101,6 +112,7 @@ def delete_truck(truck_id):
         db.session.delete(truck)
         db.session.commit()
         logging.info(f"Truck deleted with ID: {truck.id}")
+        event_bus.publish("truck.deleted", id=str(truck_uuid))
         return jsonify({"message": "Truck deleted"}), 200
     except Exception as e:
         logging.exception("Exception occurred while deleting truck")
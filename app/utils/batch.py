@@ -0,0 +1,272 @@
+# app/utils/batch.py
+"""Plan delivery instances offline, without the web app.
+
+Usage::
+
+    python -m app.utils.batch day1.json day2.json ... --jobs 4 \\
+        --out-dir plans/ --report report.csv
+    python -m app.utils.batch --orders orders.csv --trucks trucks.csv \\
+        --daily-limit 800 --out-dir plans/
+    python -m app.utils.batch --db [--db-url URL] --out-dir plans/
+
+An instance file is JSON with ``orders``, ``trucks``, ``daily_limit`` and
+optional ``products``, shaped like the planner's inputs; ``--orders`` and
+``--trucks`` also take CSV files with those fields as columns. ``--db``
+reads the pending orders, trucks and product limits straight from the
+configured database. Instances are solved in parallel worker processes;
+each plan is written to ``<out-dir>/<instance>.json`` and the report has one
+timing row per instance.
+
+Flask and the solvers are only imported once there is work to do, so the
+command starts fast enough to be called in a loop.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+
+DEFAULT_DAILY_LIMIT = 800  # same default as DAILY_PRODUCTION_LIMIT
+PENDING_STATUSES = ("Pending", "en attente")
+REPORT_FIELDS = [
+    "instance", "orders", "trucks", "engine", "status", "objective",
+    "served", "unassigned", "wall_time",
+]
+NUMERIC_FIELDS = {"quantity": float, "priority": int, "capacity": float,
+                  "daily_limit": float, "stock": float}
+
+
+def _typed(row):
+    """CSV cells as the planner expects them: numbers parsed, blanks None."""
+    return {
+        key: (NUMERIC_FIELDS[key](value) if key in NUMERIC_FIELDS else value)
+        if value not in ("", None) else None
+        for key, value in row.items()
+    }
+
+
+def read_records(path, key):
+    """Rows of a CSV file, or the ``key`` list (or whole list) of a JSON file."""
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            return [_typed(row) for row in csv.DictReader(f)]
+    with open(path) as f:
+        data = json.load(f)
+    return data[key] if isinstance(data, dict) else data
+
+
+def read_instance(path):
+    """An instance file as ``(name, orders, trucks, daily_limit, products)``."""
+    with open(path) as f:
+        data = json.load(f)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (
+        name, data["orders"], data["trucks"],
+        data.get("daily_limit", DEFAULT_DAILY_LIMIT), data.get("products"),
+    )
+
+
+def _database_url(url=None):
+    """The app's database URL; relative SQLite paths live in ``instance/``
+    as Flask-SQLAlchemy resolves them."""
+    from sqlalchemy.engine import make_url
+
+    if url is None:
+        from config import Config
+        url = Config.SQLALCHEMY_DATABASE_URI
+    url = make_url(url)
+    if url.drivername.startswith("sqlite") and url.database not in (None, "", ":memory:") \
+            and not os.path.isabs(url.database):
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        url = url.set(database=os.path.join(root, "instance", url.database))
+    return url
+
+
+def _id(value):
+    """UUID columns read back as hex on SQLite; give them their usual form."""
+    import uuid
+
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return str(value)
+
+
+def read_database(url=None):
+    """Pending orders, trucks and product limits, read with plain SQL."""
+    from sqlalchemy import bindparam, create_engine, text
+
+    engine = create_engine(_database_url(url))
+    with engine.connect() as conn:
+        orders = [
+            {
+                "id": _id(row.id),
+                "quantity": row.quantity,
+                "priority": row.priority_level or 1,
+                "date": str(row.requested_date) if row.requested_date else None,
+                "product": _id(row.product_id),
+            }
+            for row in conn.execute(
+                text(
+                    "SELECT o.id, o.quantity, o.requested_date, o.product_id,"
+                    " c.priority_level FROM orders o"
+                    " LEFT JOIN clients c ON c.id = o.client_id"
+                    " WHERE o.status IN :statuses"
+                ).bindparams(bindparam("statuses", expanding=True)),
+                {"statuses": list(PENDING_STATUSES)},
+            )
+        ]
+        trucks = [
+            {"id": _id(row.id), "capacity": row.capacity}
+            for row in conn.execute(text("SELECT id, capacity FROM trucks"))
+        ]
+        products = {
+            _id(row.id): {"capacity": row.daily_capacity, "stock": row.stock}
+            for row in conn.execute(text(
+                "SELECT id, daily_capacity, stock FROM products"
+                " WHERE daily_capacity IS NOT NULL OR stock IS NOT NULL"
+            ))
+        }
+    engine.dispose()
+    return orders, trucks, products
+
+
+def _set_telemetry(path):
+    """Record runs in ``path`` only (nowhere without one), here and in any
+    process started from now on, such as ``plan_schedule``'s pool."""
+    from app.utils import telemetry
+
+    os.environ["SOLVER_TELEMETRY_FILE"] = path or ""
+    telemetry.TELEMETRY_FILE = path or ""
+
+
+def solve_instance(instance, options):
+    """Plan one instance; returns its report row and the plan."""
+    from app.utils.planner import plan_schedule
+
+    name, orders, trucks, daily_limit, products = instance
+    started = time.perf_counter()
+    result = plan_schedule(orders, trucks, daily_limit, products=products, **options)
+    row = {
+        "instance": name,
+        "orders": len(orders),
+        "trucks": len(trucks),
+        "engine": result["engine"],
+        "status": result["status"],
+        "objective": result["objective"],
+        "served": len(orders) - len(result["unassigned"]),
+        "unassigned": len(result["unassigned"]),
+        "wall_time": time.perf_counter() - started,
+    }
+    return row, result
+
+
+def run_batch(instances, options, jobs=1, out_dir=None, telemetry_file=None,
+              log=print):
+    """Solve ``instances`` on ``jobs`` processes and return the report rows.
+
+    Plans are written to ``out_dir`` as they finish. Solver runs are only
+    recorded in the telemetry file when ``telemetry_file`` is given.
+    """
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    def finished(row, result):
+        if out_dir:
+            with open(os.path.join(out_dir, f"{row['instance']}.json"), "w") as f:
+                json.dump(result, f, indent=2, default=str)
+        if log:
+            log(
+                f"{row['instance']}: {row['status']} obj={row['objective']} "
+                f"served={row['served']}/{row['orders']} {row['wall_time']:.3f}s"
+            )
+        return row
+
+    if jobs == 1 or len(instances) == 1:
+        _set_telemetry(telemetry_file)
+        return [finished(*solve_instance(instance, options)) for instance in instances]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # One process per instance already; the planner must not fork again
+    options = dict(options, max_workers=1)
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=_set_telemetry, initargs=(telemetry_file,)
+    ) as pool:
+        futures = [pool.submit(solve_instance, instance, options) for instance in instances]
+        return [finished(*future.result()) for future in futures]
+
+
+def write_report(rows, path):
+    """Write rows as CSV (``.csv``) or JSON."""
+    with open(path, "w", newline="") as f:
+        if path.endswith(".csv"):
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("instances", nargs="*", help="instance JSON files")
+    parser.add_argument("--orders", help="orders JSON or CSV file")
+    parser.add_argument("--trucks", help="trucks JSON or CSV file")
+    parser.add_argument("--products", help="JSON {product_id: {capacity, stock}}")
+    parser.add_argument("--daily-limit", type=float, default=DEFAULT_DAILY_LIMIT)
+    parser.add_argument("--db", action="store_true",
+                        help="plan the pending orders in the database")
+    parser.add_argument("--db-url", help="database URL (default: config.py)")
+    parser.add_argument("--engine", default="cp-sat",
+                        help="cp-sat, mip, greedy or auto")
+    parser.add_argument("--strict", action="store_true",
+                        help="serve every order or report the day infeasible")
+    parser.add_argument("--max-splits", type=int, default=1)
+    parser.add_argument("--min-split", type=float)
+    parser.add_argument("--time-limit", type=float,
+                        help="solver budget per solve, in seconds")
+    parser.add_argument("--workers", type=int, help="solver threads")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--gap-limit", type=float)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="instances solved in parallel")
+    parser.add_argument("--out-dir", help="directory for the plans")
+    parser.add_argument("--report", help="timing report path (.csv or .json)")
+    parser.add_argument("--telemetry", help="also record runs in this file")
+    args = parser.parse_args(argv)
+
+    instances = [read_instance(path) for path in args.instances]
+    if args.orders or args.trucks:
+        if not (args.orders and args.trucks):
+            parser.error("--orders and --trucks go together")
+        products = None
+        if args.products:
+            with open(args.products) as f:
+                products = json.load(f)
+        instances.append((
+            os.path.splitext(os.path.basename(args.orders))[0],
+            read_records(args.orders, "orders"),
+            read_records(args.trucks, "trucks"),
+            args.daily_limit, products,
+        ))
+    if args.db:
+        orders, trucks, products = read_database(args.db_url)
+        instances.append(("db", orders, trucks, args.daily_limit, products))
+    if not instances:
+        parser.error("give instance files, --orders/--trucks or --db")
+
+    options = {"allow_unassigned": not args.strict, "engine": args.engine,
+               "max_splits": args.max_splits}
+    for option in ("min_split", "time_limit", "workers", "seed", "gap_limit"):
+        if getattr(args, option) is not None:
+            options[option] = getattr(args, option)
+
+    rows = run_batch(instances, options, args.jobs, args.out_dir, args.telemetry)
+    if args.report:
+        write_report(rows, args.report)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# app/utils/benchmark.py
+"""Synthetic instances and a benchmark runner for the schedule solvers.
+
+Usage::
+
+    python -m app.utils.benchmark --scales 10x5,100x20 --seeds 3 \\
+        --out bench_output.json [--baseline previous.json]
+
+Every case runs in a forked child process so results do not share the
+solver cache and the memory figure is that case's own peak. The report ends
+with the engine to use per instance size, in the form of the scheduler's
+``AUTO_ENGINE_RULES``.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import time
+
+from app.utils import telemetry
+from app.utils.scheduler import DEFAULT_TIME_LIMIT, DEFAULT_WORKERS, solve_schedule
+
+# (orders, trucks) from a quiet day up to the largest planning runs
+SCALES = [(10, 5), (50, 10), (100, 20), (300, 60), (1000, 100), (2000, 200)]
+ENGINES = ["cp-sat", "mip", "greedy"]
+
+# Typical order sizes in tonnes (bags pallets up to full bulk loads) and how
+# often they occur
+ORDER_SIZES = [2.5, 5, 10, 12.5, 15, 20, 25, 30, 35, 40]
+ORDER_WEIGHTS = [3, 8, 12, 6, 10, 14, 14, 12, 6, 4]
+PRIORITY_WEIGHTS = {1: 45, 2: 25, 3: 15, 4: 10, 5: 5}
+TRUCK_CAPACITIES = [20, 25, 30, 35, 40]
+TRUCK_WEIGHTS = [10, 20, 35, 20, 15]
+
+REPORT_FIELDS = [
+    "orders", "trucks", "seed", "engine", "status", "objective", "bound",
+    "gap", "wall_time", "peak_memory_mb", "served", "unassigned",
+]
+
+
+def generate_instance(num_orders, num_trucks, seed=0, load_factor=1.2):
+    """Return a reproducible ``(orders, trucks, daily_limit)`` instance.
+
+    ``load_factor`` is demand over daily limit: above 1 the day is
+    overloaded and the solver has to choose which orders to serve.
+    """
+    rng = random.Random(seed)
+    orders = []
+    for i in range(num_orders):
+        size = rng.choices(ORDER_SIZES, ORDER_WEIGHTS)[0]
+        # Some customers order odd quantities around the usual loads
+        if rng.random() < 0.2:
+            size = max(1.0, size + rng.choice([-2.5, -1, 1, 2.5]))
+        orders.append({
+            "id": f"o{i}",
+            "quantity": size,
+            "priority": rng.choices(
+                list(PRIORITY_WEIGHTS), list(PRIORITY_WEIGHTS.values())
+            )[0],
+        })
+    trucks = [
+        {"id": f"t{j}", "capacity": rng.choices(TRUCK_CAPACITIES, TRUCK_WEIGHTS)[0]}
+        for j in range(num_trucks)
+    ]
+    demand = sum(o["quantity"] for o in orders)
+    daily_limit = round(demand / load_factor, 2)
+    return orders, trucks, daily_limit
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_case(num_orders, num_trucks, seed, engine, solver_options, queue):
+    """Child-process body: solve one case and report its measurements."""
+    # Synthetic runs stay out of the production solver telemetry
+    telemetry.TELEMETRY_FILE = ""
+    orders, trucks, daily_limit = generate_instance(num_orders, num_trucks, seed)
+    baseline = _peak_rss_mb()
+    started = time.perf_counter()
+    result = solve_schedule(
+        orders, trucks, daily_limit, allow_unassigned=True,
+        engine=engine, use_cache=False, **solver_options,
+    )
+    wall_time = time.perf_counter() - started
+
+    bound = result.get("bound")
+    objective = result["objective"]
+    gap = None
+    if bound and objective is not None:
+        gap = (bound - objective) / bound
+    queue.put({
+        "orders": num_orders,
+        "trucks": num_trucks,
+        "seed": seed,
+        "engine": engine,
+        "status": result["status"],
+        "objective": objective,
+        "bound": bound,
+        "gap": gap,
+        "wall_time": wall_time,
+        "peak_memory_mb": _peak_rss_mb() - baseline,
+        "served": num_orders - len(result["unassigned"]),
+        "unassigned": len(result["unassigned"]),
+    })
+
+
+def run_case(num_orders, num_trucks, seed, engine, solver_options=None):
+    """Run one benchmark case in a forked child and return its row."""
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(
+        target=_run_case,
+        args=(num_orders, num_trucks, seed, engine, solver_options or {}, queue),
+    )
+    process.start()
+    row = queue.get()
+    process.join()
+    return row
+
+
+def run_benchmark(scales=SCALES, engines=ENGINES, seeds=1, log=print,
+                  solver_options=None):
+    rows = []
+    for num_orders, num_trucks in scales:
+        for seed in range(seeds):
+            for engine in engines:
+                row = run_case(num_orders, num_trucks, seed, engine, solver_options)
+                rows.append(row)
+                if log:
+                    log(
+                        f"{num_orders}x{num_trucks} seed={seed} {engine}: "
+                        f"{row['status']} obj={row['objective']} "
+                        f"gap={row['gap']} {row['wall_time']:.3f}s "
+                        f"{row['peak_memory_mb']:.1f}MB"
+                    )
+    return rows
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_report(rows, path):
+    """Write rows as CSV (``.csv``) or as JSON with run metadata."""
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return
+
+    import ortools
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "ortools": ortools.__version__,
+        "cpu_count": multiprocessing.cpu_count(),
+        "results": rows,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path):
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        for row in rows:
+            for field in ("orders", "trucks", "seed"):
+                row[field] = int(row[field])
+            for field in ("objective", "wall_time"):
+                row[field] = float(row[field]) if row[field] else None
+        return rows
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare(rows, baseline_rows):
+    """Pair each row with the baseline run of the same case.
+
+    Returns dicts with the wall-time ratio (new / old) and objective change.
+    """
+    def case(row):
+        return (row["orders"], row["trucks"], row["seed"], row["engine"])
+
+    baseline = {case(row): row for row in baseline_rows}
+    comparison = []
+    for row in rows:
+        old = baseline.get(case(row))
+        if not old:
+            continue
+        comparison.append({
+            "case": "{}x{} seed={} {}".format(*case(row)),
+            "wall_time_ratio": (
+                row["wall_time"] / old["wall_time"] if old["wall_time"] else None
+            ),
+            "objective_change": (
+                row["objective"] - old["objective"]
+                if row["objective"] is not None and old["objective"] is not None
+                else None
+            ),
+        })
+    return comparison
+
+
+def recommend(rows, tolerance=0.01):
+    """Pick an engine per scale from benchmark rows.
+
+    The winner is the fastest engine whose mean objective is within
+    ``tolerance`` (relative) of the best one at that scale. Returns rules
+    shaped like ``AUTO_ENGINE_RULES``: ``[(max orders x trucks, engine)]``,
+    the last one open-ended.
+    """
+    by_scale = {}
+    for row in rows:
+        scale = row["orders"] * row["trucks"]
+        by_scale.setdefault(scale, {}).setdefault(row["engine"], []).append(row)
+
+    winners = []
+    for scale, engines in sorted(by_scale.items()):
+        means = {}
+        for engine, runs in engines.items():
+            objectives = [r["objective"] or 0 for r in runs]
+            means[engine] = (
+                sum(objectives) / len(objectives),
+                sum(r["wall_time"] for r in runs) / len(runs),
+            )
+        best = max(objective for objective, wall_time in means.values())
+        good = [e for e, (objective, _) in means.items()
+                if objective >= best * (1 - tolerance)]
+        winners.append((scale, min(good, key=lambda e: means[e][1])))
+
+    rules = []
+    for scale, engine in winners:
+        if rules and rules[-1][1] == engine:
+            rules[-1] = (scale, engine)
+        else:
+            rules.append((scale, engine))
+    if rules:
+        rules[-1] = (None, rules[-1][1])
+    return rules
+
+
+def _parse_scales(value):
+    return [tuple(int(n) for n in scale.split("x")) for scale in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=_parse_scales, default=SCALES,
+                        help="comma separated ORDERSxTRUCKS, e.g. 10x5,300x60")
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--seeds", type=int, default=1)
+    parser.add_argument("--out", default="bench_output.json",
+                        help="report path (.json or .csv)")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT,
+                        help="solver budget per case, in seconds")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="solver threads (0 = solver default)")
+    args = parser.parse_args(argv)
+
+    rows = run_benchmark(
+        args.scales, args.engines.split(","), args.seeds,
+        solver_options={"time_limit": args.time_limit, "workers": args.workers},
+    )
+    write_report(rows, args.out)
+    print(f"Report written to {args.out}")
+    print(f"Suggested AUTO_ENGINE_RULES = {recommend(rows)}")
+
+    if args.baseline:
+        for line in compare(rows, load_report(args.baseline)):
+            ratio = line["wall_time_ratio"]
+            change = line["objective_change"]
+            print(
+                f"{line['case']}: "
+                f"time {'x%.2f' % ratio if ratio is not None else 'n/a'}, "
+                f"objective {'%+g' % change if change is not None else 'n/a'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
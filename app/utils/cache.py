@@ -0,0 +1,79 @@
+# app/utils/cache.py
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+def fingerprint(orders, trucks, daily_limit, **params):
+    """Stable hash of a solver instance.
+
+    Only the fields the solver reads are hashed, in id order, so the key
+    does not depend on row order or on bookkeeping keys added to the dicts.
+    Any change to an order, a truck, a client priority (carried by the
+    order's ``priority``), the limit or a solver parameter gives a new key,
+    which is what invalidates stale results.
+    """
+    normalized = {
+        "orders": sorted(
+            [
+                o["id"],
+                round(o["quantity"], 2),
+                o.get("priority", 1),
+                str(o.get("date")) if o.get("date") is not None else None,
+                o.get("product"),
+            ]
+            for o in orders
+        ),
+        "trucks": sorted(
+            [t["id"], round(t.get("capacity") or 0, 2)] for t in trucks
+        ),
+        "daily_limit": round(daily_limit, 2),
+        "params": params,
+    }
+    payload = json.dumps(normalized, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU cache of solver results keyed by ``fingerprint``."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a copy of the cached result, or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(self._entries[key])
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = copy.deepcopy(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
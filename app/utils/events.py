@@ -0,0 +1,97 @@
+# app/utils/events.py
+import json
+import queue
+import threading
+import time
+
+# Events kept for clients that reconnect with a Last-Event-ID
+BACKLOG_SIZE = 1000
+# Events buffered per subscriber before it is told to resync instead
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class Subscription:
+    """One listener's queue of events."""
+
+    def __init__(self, missed):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Set when events were lost: the client must reload its snapshot
+        self.resync = missed
+
+    def get(self, timeout):
+        """Next event, or None when ``timeout`` seconds pass without one."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """In-process publish/subscribe for change events.
+
+    Route handlers ``publish`` after their commit; every subscriber (one per
+    open event stream) gets a copy. Ids increase across restarts (they start
+    from the clock), so a client resuming from an id the backlog no longer
+    holds, or from another process's id, is told to resync rather than
+    silently missing events.
+    """
+
+    def __init__(self, backlog=BACKLOG_SIZE):
+        self._next_id = time.time_ns() // 1_000_000
+        self._backlog = []
+        self._backlog_size = backlog
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, **data):
+        """Send ``{'id', 'type', 'data'}`` to every subscriber; returns it."""
+        with self._lock:
+            self._next_id += 1
+            event = {"id": self._next_id, "type": event_type, "data": data}
+            self._backlog.append(event)
+            del self._backlog[:-self._backlog_size]
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                subscription.resync = True
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """Start listening, first replaying the events after ``last_event_id``."""
+        with self._lock:
+            missed = False
+            replay = []
+            if last_event_id is not None:
+                replay = [e for e in self._backlog if e["id"] > last_event_id]
+                oldest = self._backlog[0]["id"] if self._backlog else self._next_id + 1
+                # Ids older than the backlog, or from the future (another
+                # process), cannot be resumed exactly
+                missed = last_event_id < oldest - 1 or last_event_id > self._next_id
+            subscription = Subscription(missed)
+            for event in replay[-SUBSCRIBER_QUEUE_SIZE:]:
+                subscription.queue.put_nowait(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+
+def sse_format(event):
+    """An event as a Server-Sent Events message."""
+    return (
+        f"id: {event['id']}\n"
+        f"event: {event['type']}\n"
+        f"data: {json.dumps(event['data'], default=str)}\n\n"
+    )
+
+
+# Change events of this process
+event_bus = EventBus()
@@ -0,0 +1,53 @@
+# app/utils/export.py
+import csv
+import io
+import tempfile
+
+from openpyxl import Workbook
+
+# Columns of the planning export, as dispatchers know them
+EXPORT_COLUMNS = ["Client", "Quantité (t)", "Produit", "Date", "Heure", "Camion"]
+# Rows a CSV chunk holds before it is sent
+CSV_CHUNK_ROWS = 500
+# Bytes of workbook kept in memory before it spills to disk
+XLSX_SPOOL_SIZE = 1024 * 1024
+
+
+def csv_chunks(rows, columns=EXPORT_COLUMNS, chunk_rows=CSV_CHUNK_ROWS):
+    """Encode dict rows as CSV, yielding a chunk every ``chunk_rows`` rows.
+
+    Starts with a UTF-8 BOM so Excel reads the accents correctly. Only one
+    chunk is held in memory at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    yield "\ufeff" + buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def xlsx_file(rows, sheet_name, columns=EXPORT_COLUMNS):
+    """Write dict rows to a write-only workbook and return it as a file.
+
+    openpyxl's write-only mode keeps each row only until it is written, and
+    the finished workbook is spooled to disk past ``XLSX_SPOOL_SIZE``, so
+    memory does not grow with the export. The file is positioned at 0.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(columns)
+    for row in rows:
+        sheet.append([row.get(column) for column in columns])
+    output = tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output
@@ -0,0 +1,147 @@
+# app/utils/jobs.py
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Finished jobs kept around for polling before the oldest are dropped
+MAX_FINISHED_JOBS = 100
+
+
+class Job:
+    """One background optimization run and its progress.
+
+    The job doubles as the solver monitor (see ``solve_schedule``): CP-SAT
+    reports every incumbent to ``on_solution`` and ``cancel`` interrupts the
+    running search through the stop callable handed to ``on_start``.
+    """
+
+    def __init__(self):
+        self.id = str(uuid.uuid4())
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.objective = None
+        self.bound = None
+        self.parts_done = 0
+        self.result = None
+        self.error = None
+        self.cancelled = False
+        self._stop = None
+        self._base_objective = 0
+        self._base_bound = 0
+        self._lock = threading.Lock()
+
+    # Solver monitor interface
+
+    def on_start(self, stop):
+        with self._lock:
+            self._stop = stop
+        if self.cancelled:
+            stop()
+
+    def on_solution(self, objective, bound, wall_time):
+        self.objective = self._base_objective + objective
+        self.bound = self._base_bound + bound
+        if self.cancelled:
+            self._stop()
+
+    def on_bound(self, bound):
+        self.bound = self._base_bound + bound
+
+    def on_part(self, result):
+        """A sub-problem finished: fold its final values into the totals."""
+        with self._lock:
+            self._stop = None
+        self.parts_done += 1
+        self._base_objective += result["objective"] or 0
+        self._base_bound += result.get("bound", result["objective"]) or 0
+        self.objective = self._base_objective
+        self.bound = self._base_bound
+
+    # Control
+
+    def cancel(self):
+        self.cancelled = True
+        with self._lock:
+            stop = self._stop
+        if stop is not None:
+            stop()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def to_dict(self, include_result=True):
+        now = self.finished_at or time.time()
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "objective": self.objective,
+            "bound": self.bound,
+            "parts_done": self.parts_done,
+            "elapsed": now - (self.started_at or now),
+            "error": self.error,
+        }
+        if include_result:
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """Run optimizations in a local thread pool and track them by id.
+
+    CP-SAT releases the GIL while searching, so threads are enough to keep
+    solves off the request path; each solve may still use several search
+    workers of its own.
+    """
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="schedule-job"
+        )
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue ``fn(*args, monitor=job, **kwargs)`` and return the job."""
+        job = Job()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel()
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, monitor=job, **kwargs)
+            job.status = "cancelled" if job.cancelled else "done"
+        except Exception as e:
+            logging.exception("Exception occurred in optimization job %s", job.id)
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [jid for jid, job in self._jobs.items() if job.finished]
+        for jid in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[jid]
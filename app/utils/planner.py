@@ -0,0 +1,350 @@
+# app/utils/planner.py
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import date as date_type, timedelta
+
+from app.utils.cache import fingerprint
+from app.utils.scheduler import result_cache, schedule_key, solve_schedule
+
+STATUS_RANK = ["OPTIMAL", "FEASIBLE", "UNKNOWN", "INFEASIBLE", "MODEL_INVALID"]
+
+
+def _date_key(value):
+    """Dates may arrive as ``date`` objects or ISO strings; key on strings."""
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def split_fleet(trucks, demand):
+    """Share one day's trucks between product families.
+
+    ``demand`` maps family -> tonnes requested. Trucks are handed out largest
+    first to the family with the most demand still uncovered, so every
+    family gets capacity in proportion to what it needs and no truck is
+    planned twice on the same day.
+    """
+    uncovered = dict(demand)
+    fleet = {family: [] for family in demand}
+    for truck in sorted(trucks, key=lambda t: -(t.get("capacity") or 0)):
+        family = max(uncovered, key=uncovered.get)
+        fleet[family].append(truck)
+        uncovered[family] -= truck.get("capacity") or 0
+    return fleet
+
+
+def partition(orders, trucks, daily_limit, families=None):
+    """Split a planning run into independent sub-problems.
+
+    Orders are grouped by ``date`` and by product family (``families`` maps
+    product id -> family name; by default each product is its own family).
+    Each date gets the whole fleet and the full ``daily_limit``; within a
+    date both are shared between families in proportion to their demand.
+    Returns a list of ``(date, family, orders, trucks, limit)`` tuples.
+    """
+    families = families or {}
+    by_date = {}
+    for order in orders:
+        family = families.get(order.get("product"), order.get("product"))
+        by_date.setdefault(_date_key(order.get("date")), {}).setdefault(
+            family, []
+        ).append(order)
+
+    parts = []
+    for date, groups in by_date.items():
+        demand = {f: sum(o["quantity"] for o in group) for f, group in groups.items()}
+        total = sum(demand.values())
+        fleet = split_fleet(trucks, demand) if len(groups) > 1 else {
+            family: list(trucks) for family in groups
+        }
+        for family, group in groups.items():
+            share = daily_limit * demand[family] / total if total else daily_limit
+            parts.append((date, family, group, fleet[family], share))
+    return parts
+
+
+def first_day_stock(parts, products):
+    """Per-part ``products`` mappings where only the earliest date may draw
+    on the opening silo stock; later dates get their daily capacity alone.
+    """
+    if not products:
+        return [None] * len(parts)
+    dates = sorted({str(date) for date, *rest in parts})
+    later = {
+        product_id: dict(limits, stock=None)
+        for product_id, limits in products.items()
+    }
+    return [products if str(date) == dates[0] else later for date, *rest in parts]
+
+
+def process_pool(max_workers=None):
+    """A process pool for the solvers.
+
+    Workers are started by a fork server (``spawn`` where there is none)
+    rather than forked from the caller: forking a threaded process, such as
+    the web server with its job and stream threads, can copy a held lock
+    into the child and deadlock it.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    method = "forkserver" if "forkserver" in methods else "spawn"
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context(method)
+    )
+
+
+def _solve_part(part, solve_kwargs):
+    """Process-pool entry point: solve one sub-problem.
+
+    The parent process owns the result cache, so workers never use it.
+    """
+    date, family, orders, trucks, limit = part
+    return solve_schedule(orders, trucks, limit, use_cache=False, **solve_kwargs)
+
+
+def plan_schedule(orders, trucks, daily_limit, families=None, max_workers=None,
+                  monitor=None, pool=None, **solve_kwargs):
+    """Plan several days and product families at once.
+
+    orders: same dicts as ``solve_schedule`` plus optional ``date`` and
+        ``product`` keys used to partition the instance
+    trucks: the fleet available on each date
+    daily_limit: production limit per date
+    families: optional {product_id: family} mapping
+    products: optional per-product limits (see ``solve_schedule``). The
+        capacity applies to every date; the opening stock only to the
+        first one (``plan_horizon`` carries leftover stock forward).
+    max_workers: process pool size (defaults to the number of CPUs); 1
+        solves the parts in this process
+    pool: optional long-lived ``process_pool`` to solve the parts in,
+        instead of starting one for this call
+    monitor: optional progress monitor (see ``solve_schedule``). Callbacks
+        cannot cross process boundaries, so with a monitor the parts are
+        solved one after another in this process; ``on_part(result)`` is
+        called for each part served from the cache, then after each solved
+        one, and a true ``cancelled`` attribute skips the remaining parts.
+
+    The sub-problems are solved in parallel worker processes and merged into
+    one result shaped like ``solve_schedule``'s; every schedule entry also
+    carries its ``date`` and ``family``, and ``parts`` summarises each
+    sub-problem. Parts are looked up in the scheduler's result cache first,
+    so re-planning only solves the parts whose inputs changed; the merged
+    plan is cached too, under its ``cache_key``.
+    """
+    parts = partition(orders, trucks, daily_limit, families)
+    part_kwargs = [
+        dict(solve_kwargs, products=products)
+        for products in first_day_stock(parts, solve_kwargs.pop("products", None))
+    ]
+
+    # Parts whose inputs were already solved come straight from the cache;
+    # only the others are sent to the solver
+    keys = [
+        schedule_key(part[2], part[3], part[4], **kwargs)
+        for part, kwargs in zip(parts, part_kwargs)
+    ]
+    results = [result_cache.get(key) for key in keys]
+    for result in results:
+        if result is not None:
+            result["cached"] = True
+    todo = [index for index, result in enumerate(results) if result is None]
+
+    if monitor is not None:
+        # Cached parts count towards the progress totals as finished ones
+        for result in results:
+            if result is not None:
+                monitor.on_part(result)
+        for index in todo:
+            if getattr(monitor, "cancelled", False):
+                part_orders = parts[index][2]
+                results[index] = {
+                    "status": "UNKNOWN",
+                    "objective": None,
+                    "schedule": [],
+                    "unassigned": [o["id"] for o in part_orders],
+                }
+                continue
+            results[index] = _solve_part(
+                parts[index], dict(part_kwargs[index], monitor=monitor)
+            )
+            if not getattr(monitor, "cancelled", False):
+                result_cache.put(keys[index], results[index])
+            monitor.on_part(results[index])
+    elif len(todo) <= 1 or max_workers == 1:
+        for index in todo:
+            results[index] = _solve_part(parts[index], part_kwargs[index])
+            result_cache.put(keys[index], results[index])
+    else:
+        with nullcontext(pool) if pool else process_pool(max_workers) as executor:
+            futures = {
+                index: executor.submit(_solve_part, parts[index], part_kwargs[index])
+                for index in todo
+            }
+            for index, future in futures.items():
+                results[index] = future.result()
+                result_cache.put(keys[index], results[index])
+
+    # With engine="auto" the parts may have been solved by different engines
+    engines = {result.get("engine") for result in results} - {None}
+    merged = {
+        "engine": (
+            engines.pop() if len(engines) == 1
+            else "mixed" if engines else solve_kwargs.get("engine", "cp-sat")
+        ),
+        "status": "OPTIMAL",
+        "objective": 0,
+        "schedule": [],
+        "unassigned": [],
+        "parts": [],
+        "cached_parts": len(parts) - len(todo),
+    }
+    for (date, family, part_orders, part_trucks, limit), result in zip(parts, results):
+        for entry in result["schedule"]:
+            merged["schedule"].append(dict(entry, date=date, family=family))
+        merged["unassigned"].extend(result["unassigned"])
+        if "splits" in result:
+            merged.setdefault("splits", []).extend(result["splits"])
+        if STATUS_RANK.index(result["status"]) > STATUS_RANK.index(merged["status"]):
+            merged["status"] = result["status"]
+        if result["objective"] is not None:
+            merged["objective"] += result["objective"]
+        if "heuristic_objective" in result:
+            merged["heuristic_objective"] = (
+                merged.get("heuristic_objective", 0) + result["heuristic_objective"]
+            )
+        merged["parts"].append({
+            "date": date,
+            "family": family,
+            "orders": len(part_orders),
+            "trucks": len(part_trucks),
+            "limit": limit,
+            "status": result["status"],
+            "objective": result["objective"],
+            "cached": result.get("cached", False),
+        })
+    if "heuristic_objective" in merged:
+        merged["gap"] = (
+            (merged["objective"] - merged["heuristic_objective"]) / merged["objective"]
+            if merged["objective"] else None
+        )
+    # Kept so the plan can be fetched again (e.g. exported) by its key; the
+    # parts' own entries are what makes re-planning fast
+    if not getattr(monitor, "cancelled", False):
+        merged["cache_key"] = fingerprint(orders, trucks, daily_limit, parts=keys)
+        result_cache.put(merged["cache_key"], merged)
+    return merged
+
+
+def plan_horizon(orders, trucks, daily_limit, start, days=7, carry_bonus=1,
+                 products=None, monitor=None, **plan_kwargs):
+    """Rolling-horizon plan over ``days`` consecutive days from ``start``.
+
+    orders: same dicts as ``plan_schedule``; ``date`` is the requested day.
+        Orders due before ``start`` (or undated) are planned from day one;
+        orders due after the horizon are left for a later run.
+    daily_limit: one limit for every day, or a {date: limit} mapping (ISO
+        strings or dates); days missing from it use its ``"default"`` entry,
+        or 0 (plant closed) without one
+    carry_bonus: priority added for every day an order has waited, so
+        orders that did not fit today win over fresh ones tomorrow
+    products: optional {product_id: {'capacity', 'stock'}} with the daily
+        production capacity and the opening silo stock on ``start``. What a
+        day produces but does not ship goes into the silo for the next day.
+
+    Days are solved in order because each one inherits the orders the
+    previous day could not serve. Every day goes through ``plan_schedule``
+    and therefore the result cache: after a change, only the days whose
+    orders (including carried ones) changed are solved again.
+    """
+    if days < 1:
+        raise ValueError("days must be at least 1")
+    if not isinstance(start, date_type):
+        start = date_type.fromisoformat(str(start))
+    horizon = [start + timedelta(days=offset) for offset in range(days)]
+    last = _date_key(horizon[-1])
+
+    if isinstance(daily_limit, dict):
+        limits = {_date_key(day): limit for day, limit in daily_limit.items()}
+    else:
+        limits = {"default": daily_limit}
+
+    due = {_date_key(day): [] for day in horizon}
+    later = []
+    for order in orders:
+        key = _date_key(order.get("date"))
+        if key is None or key < _date_key(start):
+            due[_date_key(start)].append(order)
+        elif key > last:
+            later.append(order["id"])
+        else:
+            due[key].append(order)
+
+    result = {
+        "engine": plan_kwargs.get("engine", "cp-sat"),
+        "status": "OPTIMAL",
+        "objective": 0,
+        "days": [],
+        "schedule": [],
+        "unassigned": [],
+        "beyond_horizon": later,
+    }
+    products = {pid: dict(supply) for pid, supply in (products or {}).items()}
+    product_of = {o["id"]: o.get("product") for o in orders}
+    carried = []
+    engines = set()
+    for day in horizon:
+        key = _date_key(day)
+        waiting = {o["id"]: o for o in carried}
+        day_orders = [dict(o, date=key) for o in due[key]] + [
+            dict(o, date=key, priority=o.get("priority", 1) + carry_bonus)
+            for o in carried
+        ]
+        limit = limits.get(key, limits.get("default", 0))
+        plan = plan_schedule(
+            day_orders, trucks, limit, products=products or None,
+            monitor=monitor, **plan_kwargs
+        )
+
+        shipped = {}
+        for entry in plan["schedule"]:
+            for order_id, tonnes in entry["order_quantities"].items():
+                product = product_of.get(order_id)
+                shipped[product] = shipped.get(product, 0) + tonnes
+        for product_id, supply in products.items():
+            if supply.get("capacity") is None and supply.get("stock") is None:
+                continue
+            supply["stock"] = max(
+                0,
+                (supply.get("stock") or 0) + (supply.get("capacity") or 0)
+                - shipped.get(product_id, 0),
+            )
+
+        unserved = set(plan["unassigned"])
+        carried = [o for o in day_orders if o["id"] in unserved]
+        result["schedule"].extend(plan["schedule"])
+        if plan["parts"]:
+            engines.add(plan["engine"])
+        if "splits" in plan:
+            result.setdefault("splits", []).extend(plan["splits"])
+        result["objective"] += plan["objective"]
+        if STATUS_RANK.index(plan["status"]) > STATUS_RANK.index(result["status"]):
+            result["status"] = plan["status"]
+        result["days"].append({
+            "date": key,
+            "limit": limit,
+            "status": plan["status"],
+            "objective": plan["objective"],
+            "orders": len(day_orders),
+            "carried_in": len(waiting),
+            "unassigned": plan["unassigned"],
+            "cached": plan["cached_parts"] == len(plan["parts"]),
+            "closing_stock": {
+                product_id: supply.get("stock")
+                for product_id, supply in products.items()
+            },
+        })
+
+    result["unassigned"] = [o["id"] for o in carried]
+    if engines:
+        result["engine"] = engines.pop() if len(engines) == 1 else "mixed"
+    return result
@@ -0,0 +1,218 @@
+# app/utils/scenarios.py
+from contextlib import nullcontext
+
+from app.utils.planner import _date_key, plan_schedule, process_pool
+
+DELTA_KEYS = {
+    "name", "daily_limit", "remove_trucks", "add_trucks", "truck_capacity",
+    "remove_orders", "add_orders", "order_changes",
+}
+# Order fields a variant may change, with the type the planner expects
+ORDER_FIELDS = {"quantity": float, "priority": int, "date": None, "product": None}
+
+
+def _number(value, cast, what, minimum=0):
+    """``value`` as a ``cast`` number of at least ``minimum``; ValueError
+    naming ``what`` otherwise."""
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{what} must be a number")
+    if not number >= minimum:  # also catches NaN
+        raise ValueError(f"{what} must be at least {minimum}")
+    return number
+
+
+def _order_change(order_id, change):
+    if not isinstance(change, dict):
+        raise ValueError(f"order_changes: {order_id} must be an object")
+    unknown = set(change) - set(ORDER_FIELDS)
+    if unknown:
+        raise ValueError(
+            f"order_changes: cannot change {', '.join(sorted(unknown))}"
+        )
+    return {
+        field: value if ORDER_FIELDS[field] is None else _number(
+            value, ORDER_FIELDS[field], f"order_changes: {order_id} {field}",
+            minimum=1 if field == "priority" else 0,
+        )
+        for field, value in change.items()
+    }
+
+
+def apply_delta(orders, trucks, daily_limit, delta):
+    """Return the ``(orders, trucks, daily_limit)`` of a what-if variant.
+
+    ``delta`` may contain:
+        daily_limit: the new production limit
+        remove_trucks: ids of trucks that are unavailable
+        add_trucks: extra trucks, e.g. hired ones, {'id', 'capacity'}
+        truck_capacity: {truck_id: capacity} overrides
+        remove_orders: ids of orders to leave out
+        add_orders: extra orders, same dicts as the planner takes; without
+            a ``date`` they are due on the base orders' day
+        order_changes: {order_id: {field: value}} for the ``quantity``,
+            ``priority``, ``date`` or ``product`` of an order
+
+    The inputs are not modified. Raises ValueError for unknown keys, ids
+    and fields, for values of the wrong shape, for bad numbers, and for
+    undated added orders when the base orders span several days: the
+    planner would give them a day of their own with the whole fleet again.
+    """
+    unknown = set(delta) - DELTA_KEYS
+    if unknown:
+        raise ValueError(f"Unknown scenario keys: {', '.join(sorted(unknown))}")
+
+    for key in ("remove_trucks", "remove_orders", "add_trucks", "add_orders"):
+        value = delta.get(key)
+        if value is not None and not isinstance(value, list):
+            raise ValueError(f"{key} must be a list")
+    for key in ("remove_trucks", "remove_orders"):
+        if not all(isinstance(i, str) for i in delta.get(key) or ()):
+            raise ValueError(f"{key} must list ids")
+    for key in ("add_trucks", "add_orders"):
+        if not all(isinstance(entry, dict) for entry in delta.get(key) or ()):
+            raise ValueError(f"{key} must list objects")
+    for key in ("truck_capacity", "order_changes"):
+        value = delta.get(key)
+        if value is not None and not isinstance(value, dict):
+            raise ValueError(f"{key} must be an object keyed by id")
+
+    truck_ids = {t["id"] for t in trucks}
+    order_ids = {o["id"] for o in orders}
+    for key, known in (
+        ("remove_trucks", truck_ids),
+        ("truck_capacity", truck_ids),
+        ("remove_orders", order_ids),
+        ("order_changes", order_ids),
+    ):
+        missing = set(delta.get(key) or ()) - known
+        if missing:
+            raise ValueError(f"{key}: unknown ids {', '.join(sorted(missing))}")
+
+    removed = set(delta.get("remove_trucks") or ())
+    capacity = {
+        truck_id: _number(value, float, f"truck_capacity: {truck_id}")
+        for truck_id, value in (delta.get("truck_capacity") or {}).items()
+    }
+    new_trucks = [
+        dict(t, capacity=capacity.get(t["id"], t.get("capacity")))
+        for t in trucks if t["id"] not in removed
+    ]
+    for n, truck in enumerate(delta.get("add_trucks") or (), 1):
+        if truck.get("capacity") is None:
+            raise ValueError("add_trucks: every truck needs a capacity")
+        new_trucks.append({
+            "id": str(truck.get("id") or f"extra-{n}"),
+            "capacity": _number(truck["capacity"], float, "add_trucks: capacity"),
+        })
+
+    # Undated added orders are due the same day as the base orders
+    days = {_date_key(o.get("date")): o.get("date") for o in orders}
+    removed = set(delta.get("remove_orders") or ())
+    changes = {
+        order_id: _order_change(order_id, change)
+        for order_id, change in (delta.get("order_changes") or {}).items()
+    }
+    new_orders = [
+        dict(o, **changes.get(o["id"], {}))
+        for o in orders if o["id"] not in removed
+    ]
+    for n, order in enumerate(delta.get("add_orders") or (), 1):
+        if order.get("quantity") is None:
+            raise ValueError("add_orders: every order needs a quantity")
+        if order.get("date") is None and len(days) > 1:
+            raise ValueError(
+                "add_orders: the orders span several days, give each a date"
+            )
+        day = order.get("date")
+        new_orders.append(dict(
+            order, id=str(order.get("id") or f"extra-order-{n}"),
+            date=day if day is not None else next(iter(days.values()), None),
+            quantity=_number(order["quantity"], float, "add_orders: quantity"),
+            priority=_number(order.get("priority", 1), int, "add_orders: priority", 1),
+        ))
+
+    # Each day is planned with the whole fleet: undated orders next to
+    # dated ones would put the same trucks on the road twice
+    new_days = {_date_key(o.get("date")) for o in new_orders}
+    if None in new_days and len(new_days) > 1 and not (None in days and len(days) > 1):
+        raise ValueError("Orders without a date cannot be mixed with dated ones")
+
+    if delta.get("daily_limit") is not None:
+        daily_limit = _number(delta["daily_limit"], float, "daily_limit")
+    return new_orders, new_trucks, daily_limit
+
+
+def summarize(name, orders, trucks, result):
+    """One comparison row: what a plan serves and how full the trucks are."""
+    quantity = {o["id"]: o["quantity"] for o in orders}
+    capacity = {t["id"]: t.get("capacity") or 0 for t in trucks}
+    served = sum(entry["load"] for entry in result["schedule"])
+    available = sum(capacity.get(entry["truck"], 0) for entry in result["schedule"])
+    return {
+        "name": name,
+        "status": result["status"],
+        "orders": len(orders),
+        "served_orders": len(orders) - len(result["unassigned"]),
+        "served_tonnage": served,
+        "unserved_tonnage": sum(quantity[i] for i in result["unassigned"]),
+        "priority_score": result["objective"],
+        "trucks": len(trucks),
+        "trucks_used": len({e["truck"] for e in result["schedule"] if e["orders"]}),
+        "utilization": served / available if available else None,
+    }
+
+
+def _solve_scenario(name, orders, trucks, daily_limit, plan_kwargs):
+    """Process-pool entry point: plan one variant."""
+    result = plan_schedule(orders, trucks, daily_limit, max_workers=1, **plan_kwargs)
+    return summarize(name, orders, trucks, result), result
+
+
+def run_scenarios(orders, trucks, daily_limit, deltas, max_workers=None,
+                  details=False, pool=None, **plan_kwargs):
+    """Plan a base instance and its what-if variants side by side.
+
+    deltas: list of changes (see ``apply_delta``), each optionally named
+    max_workers: process pool size; variants are solved concurrently, or
+        in this process with 1
+    pool: optional long-lived ``process_pool`` to solve the variants in,
+        instead of starting one for this call
+    details: also return each variant's full plan
+
+    Returns ``{'scenarios': rows}`` where the first row is the base plan and
+    every row carries its change in served tonnage and priority score
+    against it (see ``summarize`` for the other columns).
+    """
+    variants = [("base", orders, trucks, daily_limit)]
+    for n, delta in enumerate(deltas, 1):
+        variants.append(
+            (delta.get("name") or f"scenario {n}",)
+            + apply_delta(orders, trucks, daily_limit, delta)
+        )
+
+    if len(variants) == 1 or max_workers == 1:
+        solved = [_solve_scenario(*variant, plan_kwargs) for variant in variants]
+    else:
+        with nullcontext(pool) if pool else process_pool(max_workers) as executor:
+            futures = [
+                executor.submit(_solve_scenario, *variant, plan_kwargs)
+                for variant in variants
+            ]
+            solved = [future.result() for future in futures]
+
+    base = solved[0][0]
+    rows = []
+    for (name, variant_orders, variant_trucks, limit), (row, result) in zip(
+        variants, solved
+    ):
+        row["daily_limit"] = limit
+        row["served_tonnage_change"] = row["served_tonnage"] - base["served_tonnage"]
+        row["priority_score_change"] = (
+            (row["priority_score"] or 0) - (base["priority_score"] or 0)
+        )
+        if details:
+            row["plan"] = result
+        rows.append(row)
+    return {"scenarios": rows}
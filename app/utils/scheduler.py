@@ -1,76 +1,1060 @@
 # app/utils/scheduler.py
+import time
+
+from ortools.linear_solver import pywraplp
 from ortools.sat.python import cp_model
 
-def optimize_schedule(orders, trucks, daily_limit):
+from app.utils.cache import ResultCache, fingerprint
+from app.utils.telemetry import record_run
+
+SCALE = 100  # Supports up to 2 decimal places of tons
+DEFAULT_MIN_SPLIT = 5  # smallest portion of a split order, in tons
+SPLIT_LIGHT_PRESOLVE = 5000  # (order, truck) pairs above which presolve is cut
+DEFAULT_TIME_LIMIT = 5  # seconds per solve, keeps the API responsive
+DEFAULT_WORKERS = 0  # solver threads, 0 = the solver's default (all cores)
+# Share of the time limit given to a seeded search as deterministic time;
+# CP-SAT counts 0.3 to 1 deterministic unit per second here, so the
+# deterministic limit, not the wall clock, is what ends a seeded run
+SEEDED_DETERMINISTIC_SHARE = 0.25
+MIP_BACKEND = "SCIP"  # any MIP solver id pywraplp.Solver.CreateSolver knows
+
+# Engine picked by ``engine="auto"``: the first rule whose size (orders x
+# trucks) is not exceeded wins. Suggested by ``python -m app.utils.benchmark``
+# (5 s budget, single core): up to ~100 orders x 20 trucks CP-SAT finds
+# plans the greedy packer misses, and faster on average than the MIP; from
+# 200 x 40 up neither exact engine improves on the greedy seed in time.
+# Re-run the benchmark on the production machine before relying on it.
+AUTO_ENGINE_RULES = [(2_000, "cp-sat"), (None, "greedy")]
+
+# Solver results shared by every caller in this process
+result_cache = ResultCache(maxsize=256)
+
+STATUS_NAMES = {
+    cp_model.OPTIMAL: "OPTIMAL",
+    cp_model.FEASIBLE: "FEASIBLE",
+    cp_model.INFEASIBLE: "INFEASIBLE",
+    cp_model.MODEL_INVALID: "MODEL_INVALID",
+    cp_model.UNKNOWN: "UNKNOWN",
+}
+
+MIP_STATUS_NAMES = {
+    pywraplp.Solver.OPTIMAL: "OPTIMAL",
+    pywraplp.Solver.FEASIBLE: "FEASIBLE",
+    pywraplp.Solver.INFEASIBLE: "INFEASIBLE",
+    pywraplp.Solver.UNBOUNDED: "MODEL_INVALID",
+    pywraplp.Solver.MODEL_INVALID: "MODEL_INVALID",
+    pywraplp.Solver.ABNORMAL: "UNKNOWN",
+    pywraplp.Solver.NOT_SOLVED: "UNKNOWN",
+}
+
+
+class ProgressCallback(cp_model.CpSolverSolutionCallback):
+    """Forward each CP-SAT incumbent to a monitor (see ``solve_schedule``).
+
+    Models whose objective is a weighted sum with tie-breakers pass the
+    ``weight`` of the main term so the monitor sees it in priority units.
     """
-    orders: list of dicts, each {'id': str, 'quantity': float, 'priority': int}
-    trucks: list of dicts, each {'id': str, 'capacity': float}
-    daily_limit: float
+
+    def __init__(self, monitor, weight=1):
+        super().__init__()
+        self.monitor = monitor
+        self.weight = weight
+
+    def on_solution_callback(self):
+        self.monitor.on_solution(
+            self.ObjectiveValue() / self.weight,
+            self.BestObjectiveBound() / self.weight,
+            self.WallTime(),
+        )
+
+
+def product_availability(products):
+    """Tonnes each product can supply today: daily capacity plus silo stock.
+
+    ``products`` maps product id -> {'capacity': float, 'stock': float};
+    products with neither value are unlimited and left out.
     """
-    SCALE = 100  # Supports up to 2 decimal places of tons
+    available = {}
+    for product_id, limits in (products or {}).items():
+        capacity = limits.get('capacity')
+        stock = limits.get('stock')
+        if capacity is None and stock is None:
+            continue
+        available[product_id] = (capacity or 0) + (stock or 0)
+    return available
 
-    model = cp_model.CpModel()
 
-    num_orders = len(orders)
-    num_trucks = len(trucks)
+def _scaled_availability(products):
+    return {
+        product_id: int(round(tonnes * SCALE))
+        for product_id, tonnes in product_availability(products).items()
+    }
 
-    # Convert all floats to ints for ortools
+
+def _prepare(orders, trucks, daily_limit):
+    """Convert all floats to ints for ortools; returns the scaled limit."""
     for o in orders:
         o['quantity_int'] = int(round(o['quantity'] * SCALE))
     for t in trucks:
-        t['capacity_int'] = int(round(t['capacity'] * SCALE))
-    daily_limit_int = int(round(daily_limit * SCALE))
+        t['capacity_int'] = int(round((t.get('capacity') or 0) * SCALE))
+    return int(round(daily_limit * SCALE))
+
+
+def configure_solver(solver, time_limit, workers, seed=None, gap_limit=None):
+    """Apply the search budget to a CP-SAT solver.
 
-    # Decision vars: x[i,j] = 1 if order i assigned to truck j
-    x = {}
-    for i in range(num_orders):
+    With a ``seed`` the run is made repeatable: several workers interleave
+    their search deterministically and the search stops on a deterministic
+    time budget (``SEEDED_DETERMINISTIC_SHARE`` of the time limit), so the
+    same inputs give the same plan. The wall-clock limit stays as a hard
+    cap; a run cut by it on a slow machine is not repeatable.
+    """
+    solver.parameters.max_time_in_seconds = time_limit
+    if workers:
+        solver.parameters.num_workers = workers
+    if seed is not None:
+        solver.parameters.random_seed = seed
+        solver.parameters.max_deterministic_time = (
+            time_limit * SEEDED_DETERMINISTIC_SHARE
+        )
+        if workers and workers > 1:
+            solver.parameters.interleave_search = True
+    if gap_limit is not None:
+        solver.parameters.relative_gap_limit = gap_limit
+
+
+def _seed_usable(plan, orders, allow_unassigned):
+    """Whether a greedy plan may stand in for a solver that found nothing
+    in time (in strict mode it must serve every order)."""
+    return allow_unassigned or len(plan) == len(orders)
+
+
+def _overloaded(orders, trucks, daily_limit_int, available):
+    """True when strict mode cannot serve every order: the demand, the
+    largest order or one product's demand is over what the day allows."""
+    max_capacity = max((t['capacity_int'] for t in trucks), default=0)
+    demand = {}
+    for o in orders:
+        product = o.get('product')
+        demand[product] = demand.get(product, 0) + o['quantity_int']
+    return (
+        sum(demand.values()) > daily_limit_int
+        or any(o['quantity_int'] > max_capacity for o in orders)
+        or any(demand[p] > tonnes for p, tonnes in available.items() if p in demand)
+    )
+
+
+def _empty_result(orders, trucks, status, engine):
+    """Result returned when no assignment could be produced."""
+    return {
+        "engine": engine,
+        "status": status,
+        "objective": None,
+        "schedule": [
+            {"truck": t["id"], "orders": [], "load": 0.0, "order_quantities": {}}
+            for t in trucks
+        ],
+        "unassigned": [o["id"] for o in orders],
+    }
+
+
+def _build_result(orders, trucks, assignment, status, engine):
+    """Turn an ``{order_index: truck_index}`` assignment into a result dict."""
+    per_truck = [[] for _ in trucks]
+    for i in sorted(assignment):
+        per_truck[assignment[i]].append(i)
+
+    schedule = []
+    for j, truck in enumerate(trucks):
+        schedule.append({
+            'truck':  truck['id'],
+            'orders': [orders[i]['id'] for i in per_truck[j]],
+            # Convert back to float tons
+            'load': sum(orders[i]['quantity_int'] for i in per_truck[j]) / SCALE,
+            'order_quantities': {
+                orders[i]['id']: orders[i]['quantity_int'] / SCALE
+                for i in per_truck[j]
+            },
+        })
+
+    return {
+        "engine": engine,
+        "status": status,
+        "objective": sum(orders[i].get('priority', 1) for i in assignment),
+        "schedule": schedule,
+        "unassigned": [
+            o['id'] for i, o in enumerate(orders) if i not in assignment
+        ],
+    }
+
+
+def capacity_classes(trucks, previous=None):
+    """Group truck indexes by identical capacity, keeping fleet order.
+
+    Only classes with more than one truck are returned; those are the ones
+    whose trucks are interchangeable for the solver. Trucks named in the
+    ``previous`` plan are distinguishable and left out. Expects ``_prepare``
+    to have run.
+    """
+    pinned = set((previous or {}).values())
+    classes = {}
+    for j, truck in enumerate(trucks):
+        if truck['id'] not in pinned:
+            classes.setdefault(truck['capacity_int'], []).append(j)
+    return [members for members in classes.values() if len(members) > 1]
+
+
+def order_types(orders, previous=None):
+    """Group order indexes the model cannot tell apart.
+
+    Orders with the same quantity, priority, product and previous truck
+    are interchangeable, so the solver only needs to decide *how many* of
+    each type go on each truck. Expects ``_prepare`` to have run.
+    """
+    previous = previous or {}
+    types = {}
+    for i, order in enumerate(orders):
+        key = (
+            order['quantity_int'],
+            order.get('priority', 1),
+            order.get('product'),
+            previous.get(order['id']),
+        )
+        types.setdefault(key, []).append(i)
+    return list(types.values())
+
+
+def _canonical_assignment(orders, assignment, classes):
+    """Relabel trucks inside each class so their loads are non-increasing.
+
+    The objective is unchanged; the result satisfies the symmetry-breaking
+    rule used by the CP-SAT model and can therefore be used as its hint.
+    """
+    loads = {}
+    for i, j in assignment.items():
+        loads[j] = loads.get(j, 0) + orders[i]['quantity_int']
+    relabel = {}
+    for members in classes:
+        ranked = sorted(members, key=lambda j: -loads.get(j, 0))
+        relabel.update(zip(ranked, members))
+    return {i: relabel.get(j, j) for i, j in assignment.items()}
+
+
+def _seed_counts(greedy, types):
+    """The greedy plan as ``{(order type, truck): orders}``, the hint for
+    the exact models' per-type count variables."""
+    type_of = {i: k for k, members in enumerate(types) for i in members}
+    counts = {}
+    for i, j in greedy.items():
+        counts[(type_of[i], j)] = counts.get((type_of[i], j), 0) + 1
+    return counts
+
+
+def _finish(result, solver_stats, seed_objective):
+    """Add what every exact engine reports: its ``solver_stats``, the greedy
+    ``heuristic_objective`` and the relative ``gap`` between the two."""
+    result["solver_stats"] = solver_stats
+    result["heuristic_objective"] = seed_objective
+    if result["objective"]:
+        result["gap"] = (result["objective"] - seed_objective) / result["objective"]
+    else:
+        result["gap"] = None
+    return result
+
+
+def _ranked(orders, indexes):
+    """Order indexes by descending priority per tonne, largest first."""
+    return sorted(
+        indexes,
+        key=lambda i: (
+            -orders[i].get('priority', 1) / max(orders[i]['quantity_int'], 1),
+            -orders[i]['quantity_int'],
+        ),
+    )
+
+
+def greedy_assignment(orders, trucks, daily_limit_int, previous=None,
+                      available=None):
+    """Priority-weighted first-fit-decreasing bin packing.
+
+    Orders kept from ``previous`` are placed on their old truck first; the
+    rest are taken by descending priority per tonne (largest first among
+    equals) and put on the first truck with room, as long as the daily
+    limit and the product's scaled ``available`` tonnage allow. Expects
+    ``_prepare`` to have run. Returns ``{order_index: truck_index}``.
+    """
+    residual = [t['capacity_int'] for t in trucks]
+    remaining = daily_limit_int
+    supply = dict(available or {})
+    assignment = {}
+
+    def fits_plant(order):
+        q = order['quantity_int']
+        return q <= remaining and q <= supply.get(order.get('product'), q)
+
+    def take(i, j):
+        nonlocal remaining
+        q = orders[i]['quantity_int']
+        assignment[i] = j
+        residual[j] -= q
+        remaining -= q
+        if orders[i].get('product') in supply:
+            supply[orders[i]['product']] -= q
+
+    if previous:
+        truck_index = {t['id']: j for j, t in enumerate(trucks)}
+        for i, order in enumerate(orders):
+            j = truck_index.get(previous.get(order['id']))
+            if j is not None and order['quantity_int'] <= residual[j] \
+                    and fits_plant(order):
+                take(i, j)
+
+    ranked = _ranked(orders, [i for i in range(len(orders)) if i not in assignment])
+    for i in ranked:
+        if not fits_plant(orders[i]):
+            continue
+        for j, room in enumerate(residual):
+            if orders[i]['quantity_int'] <= room:
+                take(i, j)
+                break
+    return assignment
+
+
+def greedy_schedule(orders, trucks, daily_limit, allow_unassigned=False,
+                    previous=None, stability_weight=0, products=None,
+                    **solver_options):
+    """Heuristic engine with the same inputs and result as ``solve_schedule``.
+
+    Runs in milliseconds but gives no optimality guarantee; in strict mode a
+    plan that leaves orders out is reported as ``UNKNOWN``. Solver options
+    (monitor, time limit, workers, seed, gap limit) do not apply and are
+    ignored.
+    """
+    daily_limit_int = _prepare(orders, trucks, daily_limit)
+    assignment = greedy_assignment(
+        orders, trucks, daily_limit_int, previous, _scaled_availability(products)
+    )
+    if not allow_unassigned and len(assignment) < len(orders):
+        return _empty_result(orders, trucks, "UNKNOWN", "greedy")
+    return _build_result(orders, trucks, assignment, "FEASIBLE", "greedy")
+
+
+def cp_sat_schedule(orders, trucks, daily_limit, allow_unassigned=False,
+                    previous=None, stability_weight=0, products=None,
+                    monitor=None, time_limit=DEFAULT_TIME_LIMIT,
+                    workers=DEFAULT_WORKERS, seed=None, gap_limit=None):
+    """Exact CP-SAT engine, seeded with the greedy plan (see
+    ``solve_schedule`` for the arguments)."""
+    engine = "cp-sat"
+
+    model = cp_model.CpModel()
+
+    num_orders = len(orders)
+    num_trucks = len(trucks)
+
+    daily_limit_int = _prepare(orders, trucks, daily_limit)
+    available = _scaled_availability(products)
+
+    # Strict mode: the demand and the largest order are known up front, so an
+    # overloaded day is rejected here instead of letting CP-SAT burn its time
+    # limit proving infeasibility.
+    if not allow_unassigned and _overloaded(
+        orders, trucks, daily_limit_int, available
+    ):
+        return _empty_result(orders, trucks, "INFEASIBLE", engine)
+
+    # Orders of the same type are interchangeable, so the decision is a
+    # count per (type, truck) instead of one bool per (order, truck).
+    types = order_types(orders, previous)
+
+    # Decision vars: n[k,j] = number of type-k orders assigned to truck j
+    # Pairs where one order alone overflows the truck are never created.
+    n = {}
+    for k, members in enumerate(types):
+        q = orders[members[0]]['quantity_int']
         for j in range(num_trucks):
-            x[(i,j)] = model.NewBoolVar(f"x_o{i}_t{j}")
+            capacity = trucks[j]['capacity_int']
+            if q > capacity:
+                continue
+            upper = min(len(members), capacity // q) if q else len(members)
+            n[(k,j)] = model.NewIntVar(0, upper, f"n_k{k}_t{j}")
 
-    # 1) Each order must go on exactly one truck
-    for i in range(num_orders):
-        model.Add(sum(x[(i,j)] for j in range(num_trucks)) == 1)
+    # 1) Each order goes on exactly one truck (at most one when optional)
+    for k, members in enumerate(types):
+        served = [n[(k,j)] for j in range(num_trucks) if (k,j) in n]
+        if allow_unassigned:
+            model.Add(sum(served) <= len(members))
+        else:
+            model.Add(sum(served) == len(members))
 
     # 2) Respect each truck’s capacity (integer tons)
+    loads = []
     for j in range(num_trucks):
-        model.Add(
-            sum(x[(i,j)] * orders[i]['quantity_int'] for i in range(num_orders))
-            <= trucks[j]['capacity_int']
+        load = sum(
+            n[(k,j)] * orders[members[0]]['quantity_int']
+            for k, members in enumerate(types) if (k,j) in n
         )
+        model.Add(load <= trucks[j]['capacity_int'])
+        loads.append(load)
 
-    # 3) Don’t exceed daily production limit
-    model.Add(
-        sum(orders[i]['quantity_int'] for i in range(num_orders))
-        <= daily_limit_int
-    )
+    # 3) Don’t exceed daily production limit (only selected orders count)
+    if allow_unassigned:
+        model.Add(sum(loads) <= daily_limit_int)
+
+    # 3b) Per product, what leaves the plant is bounded by the day's
+    #     production plus the opening silo stock
+    for product_id, tonnes in available.items():
+        shipped = [
+            var * orders[types[k][0]]['quantity_int']
+            for (k, j), var in n.items()
+            if orders[types[k][0]].get('product') == product_id
+        ]
+        if shipped:
+            model.Add(sum(shipped) <= tonnes)
 
     # 4) Maximize total priority served
     #    (higher-priority orders give more “score”)
     objective_terms = []
-    for i in range(num_orders):
-        prio = orders[i].get('priority', 1)
-        for j in range(num_trucks):
-            objective_terms.append(prio * x[(i,j)])
+    for (k, j), var in n.items():
+        prio = orders[types[k][0]].get('priority', 1)
+        objective_terms.append(prio * var)
+
+    # 5) Optionally reward keeping orders on their previous truck
+    if previous and stability_weight:
+        for (k, j), var in n.items():
+            if previous.get(orders[types[k][0]]['id']) == trucks[j]['id']:
+                objective_terms.append(stability_weight * var)
     model.Maximize(sum(objective_terms))
 
+    # 6) Symmetry breaking: trucks of the same capacity are interchangeable,
+    #    so within each class loads must be non-increasing in fleet order.
+    #    Any plan can be relabelled to satisfy this, so the optimum is kept.
+    classes = capacity_classes(trucks, previous)
+    for members in classes:
+        for a, b in zip(members, members[1:]):
+            model.Add(loads[a] >= loads[b])
+
+    # 7) Warm start: the greedy plan (which already keeps the previous
+    #    assignment where it still fits) is the solver's initial hint
+    greedy = greedy_assignment(orders, trucks, daily_limit_int, previous, available)
+    greedy = _canonical_assignment(orders, greedy, classes)
+    seed_counts = _seed_counts(greedy, types)
+    for key, var in n.items():
+        model.AddHint(var, seed_counts.get(key, 0))
+    seed_objective = sum(orders[i].get('priority', 1) for i in greedy)
+
     # Solve
     solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 5  # keep it fast
-    status = solver.Solve(model)
+    configure_solver(solver, time_limit, workers, seed, gap_limit)
+    if monitor is not None:
+        monitor.on_start(solver.StopSearch)
+        solver.best_bound_callback = monitor.on_bound
+        status = solver.Solve(model, ProgressCallback(monitor))
+    else:
+        status = solver.Solve(model)
 
-    # Build the output
-    result = []
-    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+    if status == cp_model.UNKNOWN and _seed_usable(greedy, orders, allow_unassigned):
+        # Out of time before a first solution: the greedy plan is still valid
+        result = _build_result(orders, trucks, greedy, "FEASIBLE", engine)
+        result["fallback"] = True
+    elif status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        result = _empty_result(
+            orders, trucks, STATUS_NAMES.get(status, "UNKNOWN"), engine
+        )
+    else:
+        # Hand out concrete orders of each type to the trucks that got them
+        assignment = {}
+        for k, members in enumerate(types):
+            pending = iter(members)
+            for j in range(num_trucks):
+                if (k,j) in n:
+                    for _ in range(solver.Value(n[(k,j)])):
+                        assignment[next(pending)] = j
+        result = _build_result(
+            orders, trucks, assignment, STATUS_NAMES[status], engine
+        )
+        result["bound"] = solver.BestObjectiveBound()
+
+    return _finish(result, {
+        "conflicts": solver.NumConflicts(),
+        "branches": solver.NumBranches(),
+    }, seed_objective)
+
+
+def mip_schedule(orders, trucks, daily_limit, allow_unassigned=False,
+                 previous=None, stability_weight=0, products=None,
+                 monitor=None, time_limit=DEFAULT_TIME_LIMIT,
+                 workers=DEFAULT_WORKERS, seed=None, gap_limit=None):
+    """Mixed-integer engine on OR-Tools' linear solver wrapper (``MIP_BACKEND``).
+
+    Same model as ``cp_sat_schedule`` (counts per order type and truck,
+    symmetry breaking, greedy hint) solved by branch and bound, which
+    proves optimality quickly on small days. The backend has no progress
+    callbacks, so a monitor only gets the final values.
+    """
+    engine = "mip"
+
+    daily_limit_int = _prepare(orders, trucks, daily_limit)
+    available = _scaled_availability(products)
+    if not allow_unassigned and _overloaded(
+        orders, trucks, daily_limit_int, available
+    ):
+        return _empty_result(orders, trucks, "INFEASIBLE", engine)
+
+    solver = pywraplp.Solver.CreateSolver(MIP_BACKEND)
+    if solver is None:
+        raise RuntimeError(f"MIP backend {MIP_BACKEND} is not available")
+
+    # Decision vars: n[k,j] = number of type-k orders assigned to truck j
+    types = order_types(orders, previous)
+    n = {}
+    for k, members in enumerate(types):
+        q = orders[members[0]]['quantity_int']
+        for j, truck in enumerate(trucks):
+            if q > truck['capacity_int']:
+                continue
+            upper = min(len(members), truck['capacity_int'] // q) if q else len(members)
+            n[(k,j)] = solver.IntVar(0, upper, f"n_k{k}_t{j}")
+
+    # 1) Each order goes on exactly one truck (at most one when optional)
+    for k, members in enumerate(types):
+        served = [n[(k,j)] for j in range(len(trucks)) if (k,j) in n]
+        if allow_unassigned:
+            solver.Add(solver.Sum(served) <= len(members))
+        else:
+            solver.Add(solver.Sum(served) == len(members))
+
+    # 2) Truck capacity, 3) daily limit and per-product availability
+    loads = []
+    for j, truck in enumerate(trucks):
+        load = solver.Sum([
+            n[(k,j)] * orders[members[0]]['quantity_int']
+            for k, members in enumerate(types) if (k,j) in n
+        ])
+        solver.Add(load <= truck['capacity_int'])
+        loads.append(load)
+    if allow_unassigned:
+        solver.Add(solver.Sum(loads) <= daily_limit_int)
+    for product_id, tonnes in available.items():
+        shipped = [
+            var * orders[types[k][0]]['quantity_int']
+            for (k, j), var in n.items()
+            if orders[types[k][0]].get('product') == product_id
+        ]
+        if shipped:
+            solver.Add(solver.Sum(shipped) <= tonnes)
+
+    # 4) Maximize total priority served, 5) plus the stability bonus
+    objective_terms = []
+    for (k, j), var in n.items():
+        order = orders[types[k][0]]
+        prio = order.get('priority', 1)
+        if previous and stability_weight \
+                and previous.get(order['id']) == trucks[j]['id']:
+            prio += stability_weight
+        objective_terms.append(prio * var)
+    solver.Maximize(solver.Sum(objective_terms))
+
+    # 6) Symmetry breaking and 7) warm start, as in the CP-SAT model
+    classes = capacity_classes(trucks, previous)
+    for members in classes:
+        for a, b in zip(members, members[1:]):
+            solver.Add(loads[a] >= loads[b])
+    greedy = greedy_assignment(orders, trucks, daily_limit_int, previous, available)
+    greedy = _canonical_assignment(orders, greedy, classes)
+    seed_counts = _seed_counts(greedy, types)
+    solver.SetHint(list(n.values()), [seed_counts.get(key, 0) for key in n])
+    seed_objective = sum(orders[i].get('priority', 1) for i in greedy)
+
+    # Solve
+    solver.SetTimeLimit(int(time_limit * 1000))
+    if workers:
+        solver.SetNumThreads(workers)
+    if seed is not None and MIP_BACKEND == "SCIP":
+        solver.SetSolverSpecificParametersAsString(
+            f"randomization/randomseedshift = {seed}\n"
+        )
+    parameters = pywraplp.MPSolverParameters()
+    if gap_limit is not None:
+        parameters.SetDoubleParam(parameters.RELATIVE_MIP_GAP, gap_limit)
+    if monitor is not None:
+        monitor.on_start(solver.InterruptSolve)
+    status = solver.Solve(parameters)
+
+    if status in (pywraplp.Solver.NOT_SOLVED, pywraplp.Solver.ABNORMAL) \
+            and _seed_usable(greedy, orders, allow_unassigned):
+        # Out of time (or interrupted) before a solution: keep the greedy plan
+        result = _build_result(orders, trucks, greedy, "FEASIBLE", engine)
+        result["fallback"] = True
+    elif status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        result = _empty_result(
+            orders, trucks, MIP_STATUS_NAMES.get(status, "UNKNOWN"), engine
+        )
+    else:
+        assignment = {}
+        for k, members in enumerate(types):
+            pending = iter(members)
+            for j in range(len(trucks)):
+                if (k,j) in n:
+                    for _ in range(int(round(n[(k,j)].solution_value()))):
+                        assignment[next(pending)] = j
+        result = _build_result(
+            orders, trucks, assignment, MIP_STATUS_NAMES[status], engine
+        )
+        # The backend reports +-1e20 when it has no bound yet
+        bound = solver.Objective().BestBound()
+        result["bound"] = bound if abs(bound) < 1e19 else None
+        if monitor is not None:
+            value = solver.Objective().Value()
+            monitor.on_solution(
+                value, value if result["bound"] is None else result["bound"],
+                solver.WallTime() / 1000,
+            )
+
+    # SCIP has no conflict count comparable to CP-SAT's; nodes are its branches
+    return _finish(
+        result, {"conflicts": None, "branches": solver.nodes()}, seed_objective
+    )
+
+
+def _split_portions(quantity, residual, min_split, max_splits):
+    """Cut ``quantity`` into at most ``max_splits`` portions for the trucks
+    with the most room left.
+
+    Portions are whole tons except the first, which also carries the
+    fraction of a ton, and none is smaller than ``min_split`` (scaled
+    units). Returns ``{truck_index: portion}`` or None when it does not fit.
+    """
+    whole_min = -(-min_split // SCALE) * SCALE
+    portions = {}
+    left = quantity
+    for j in sorted(range(len(residual)), key=lambda j: -residual[j]):
+        if left == 0 or len(portions) == max_splits:
+            break
+        room = residual[j]
+        if room >= left:
+            portions[j] = left
+            left = 0
+            break
+        # Keep what is left a whole number of tons, and big enough to be
+        # a portion of its own
+        take = min(room - (room - left) % SCALE, left - whole_min)
+        if take < min_split:
+            continue
+        portions[j] = take
+        left -= take
+    return portions if left == 0 else None
+
+
+def greedy_split_assignment(orders, trucks, daily_limit_int, min_split,
+                            max_splits, previous=None, available=None):
+    """``greedy_assignment`` followed by a pass that splits the orders left
+    out across the spare capacity of the fleet.
+
+    ``min_split`` is in scaled units. Returns
+    ``{order_index: {truck_index: scaled quantity}}``.
+    """
+    whole = greedy_assignment(orders, trucks, daily_limit_int, previous, available)
+    portions = {i: {j: orders[i]['quantity_int']} for i, j in whole.items()}
+    residual = [t['capacity_int'] for t in trucks]
+    remaining = daily_limit_int
+    supply = dict(available or {})
+    for i, j in whole.items():
+        q = orders[i]['quantity_int']
+        residual[j] -= q
+        remaining -= q
+        if orders[i].get('product') in supply:
+            supply[orders[i]['product']] -= q
+
+    for i in _ranked(orders, [i for i in range(len(orders)) if i not in whole]):
+        q = orders[i]['quantity_int']
+        product = orders[i].get('product')
+        if q > remaining or q > supply.get(product, q):
+            continue
+        split = _split_portions(q, residual, min(min_split, q), max_splits)
+        if split is None:
+            continue
+        portions[i] = split
+        for j, portion in split.items():
+            residual[j] -= portion
+        remaining -= q
+        if product in supply:
+            supply[product] -= q
+    return portions
+
+
+def _build_split_result(orders, trucks, portions, status, engine):
+    """Turn ``{order_index: {truck_index: quantity}}`` into a result dict.
+
+    Every schedule entry lists the tonnes of each order it carries in
+    ``order_quantities``, the shape ``create_delivery`` takes; ``splits``
+    lists the orders served by more than one truck.
+    """
+    schedule = []
+    for j, truck in enumerate(trucks):
+        carried = {
+            i: split[j] for i, split in sorted(portions.items()) if split.get(j)
+        }
+        schedule.append({
+            'truck': truck['id'],
+            'orders': [orders[i]['id'] for i in carried],
+            'load': sum(carried.values()) / SCALE,
+            'order_quantities': {
+                orders[i]['id']: portion / SCALE for i, portion in carried.items()
+            },
+        })
+
+    return {
+        "engine": engine,
+        "status": status,
+        "objective": sum(orders[i].get('priority', 1) for i in portions),
+        "schedule": schedule,
+        "splits": [
+            {
+                "order": orders[i]['id'],
+                "portions": [
+                    {"truck": trucks[j]['id'], "quantity": portion / SCALE}
+                    for j, portion in split.items() if portion
+                ],
+            }
+            for i, split in sorted(portions.items())
+            if sum(1 for portion in split.values() if portion) > 1
+        ],
+        "unassigned": [
+            o['id'] for i, o in enumerate(orders) if i not in portions
+        ],
+    }
+
+
+def split_schedule(orders, trucks, daily_limit, allow_unassigned=False,
+                   previous=None, stability_weight=0, engine="cp-sat",
+                   products=None, min_split=DEFAULT_MIN_SPLIT, max_splits=2,
+                   monitor=None, time_limit=DEFAULT_TIME_LIMIT,
+                   workers=DEFAULT_WORKERS, seed=None, gap_limit=None):
+    """Assignment where an order may be shared by up to ``max_splits``
+    trucks, in portions of at least ``min_split`` tons (see
+    ``solve_schedule`` for the other arguments).
+
+    An order is served in full or not at all. With ``engine="greedy"`` only
+    the splitting heuristic runs; any other engine solves the CP-SAT split
+    model, seeded with the heuristic.
+    """
+    daily_limit_int = _prepare(orders, trucks, daily_limit)
+    available = _scaled_availability(products)
+    min_split_int = int(round(min_split * SCALE))
+
+    greedy = greedy_split_assignment(
+        orders, trucks, daily_limit_int, min_split_int, max_splits,
+        previous, available,
+    )
+    if engine == "greedy":
+        if not _seed_usable(greedy, orders, allow_unassigned):
+            return _empty_result(orders, trucks, "UNKNOWN", engine)
+        return _build_split_result(orders, trucks, greedy, "FEASIBLE", engine)
+
+    engine = "cp-sat"
+    model = cp_model.CpModel()
+
+    # Decision vars: portion[i,j] = scaled tons of order i on truck j, made
+    # of whole tons (w) plus, on one truck only, the order's fraction (f);
+    # u[i,j] = 1 if truck j carries part of order i
+    served = {}
+    u = {}
+    whole = {}
+    portion = {}
+    fraction = {}
+    for i, order in enumerate(orders):
+        q = order['quantity_int']
+        frac = q % SCALE
+        smallest = min(min_split_int, q)
+        served[i] = model.NewBoolVar(f"served_o{i}")
+        if not allow_unassigned:
+            model.Add(served[i] == 1)
         for j, truck in enumerate(trucks):
-            assigned = []
-            load_int = 0
-            for i, order in enumerate(orders):
-                if solver.Value(x[(i,j)]) == 1:
-                    assigned.append(order['id'])
-                    load_int += order['quantity_int']
-            result.append({
-                'truck':  truck['id'],
-                'orders': assigned,
-                'load': load_int / SCALE  # Convert back to float tons
-            })
+            capacity = min(truck['capacity_int'], q)
+            if capacity < smallest:
+                continue
+            u[(i,j)] = model.NewBoolVar(f"u_o{i}_t{j}")
+            whole[(i,j)] = model.NewIntVar(0, capacity // SCALE, f"w_o{i}_t{j}")
+            portion[(i,j)] = SCALE * whole[(i,j)]
+            if frac:
+                fraction[(i,j)] = model.NewBoolVar(f"f_o{i}_t{j}")
+                model.AddImplication(fraction[(i,j)], u[(i,j)])
+                portion[(i,j)] += frac * fraction[(i,j)]
+            model.Add(portion[(i,j)] >= smallest).OnlyEnforceIf(u[(i,j)])
+            model.Add(portion[(i,j)] <= capacity * u[(i,j)])
+
+        # 1) A served order is delivered in full, by at most max_splits trucks
+        parts = [j for j in range(len(trucks)) if (i,j) in u]
+        model.Add(sum(portion[(i,j)] for j in parts) == q * served[i])
+        model.Add(sum(u[(i,j)] for j in parts) <= max_splits * served[i])
+        if frac:
+            model.Add(sum(fraction[(i,j)] for j in parts) == served[i])
+
+    # 2) Respect each truck's capacity
+    for j, truck in enumerate(trucks):
+        model.Add(
+            sum(portion[(i,j)] for i in range(len(orders)) if (i,j) in portion)
+            <= truck['capacity_int']
+        )
+
+    # 3) Daily production limit and per-product availability
+    model.Add(
+        sum(o['quantity_int'] * served[i] for i, o in enumerate(orders))
+        <= daily_limit_int
+    )
+    for product_id, tonnes in available.items():
+        shipped = [
+            o['quantity_int'] * served[i] for i, o in enumerate(orders)
+            if o.get('product') == product_id
+        ]
+        if shipped:
+            model.Add(sum(shipped) <= tonnes)
+
+    # 4) Maximize priority served, then use as few portions as possible;
+    #    keeping an order on its previous truck earns the stability bonus
+    weight = len(u) + 1
+    bonus = []
+    if previous and stability_weight:
+        truck_index = {t['id']: j for j, t in enumerate(trucks)}
+        for i, order in enumerate(orders):
+            j = truck_index.get(previous.get(order['id']))
+            if (i,j) in u:
+                bonus.append(stability_weight * u[(i,j)])
+    model.Maximize(
+        weight * sum(o.get('priority', 1) * served[i] for i, o in enumerate(orders))
+        + weight * sum(bonus)
+        - sum(u.values())
+    )
+
+    # 5) Warm start from the splitting heuristic
+    for i, order in enumerate(orders):
+        split = greedy.get(i, {})
+        model.AddHint(served[i], int(i in greedy))
+        for j in range(len(trucks)):
+            if (i,j) not in u:
+                continue
+            carried = split.get(j, 0)
+            model.AddHint(u[(i,j)], int(carried > 0))
+            model.AddHint(whole[(i,j)], carried // SCALE)
+            if (i,j) in fraction:
+                model.AddHint(fraction[(i,j)], int(carried % SCALE > 0))
+    seed_objective = sum(orders[i].get('priority', 1) for i in greedy)
+
+    # Solve
+    solver = cp_model.CpSolver()
+    configure_solver(solver, time_limit, workers, seed, gap_limit)
+    # The order x truck grid is large and full presolve (probing, symmetry
+    # detection) can use the whole time limit before the hint is even
+    # loaded, so lighten it, and skip it entirely on big fleets
+    solver.parameters.cp_model_probing_level = 1
+    if len(u) > SPLIT_LIGHT_PRESOLVE:
+        solver.parameters.cp_model_probing_level = 0
+        solver.parameters.symmetry_level = 0
+    if monitor is not None:
+        monitor.on_start(solver.StopSearch)
+        solver.best_bound_callback = lambda bound: monitor.on_bound(bound / weight)
+        status = solver.Solve(model, ProgressCallback(monitor, weight))
+    else:
+        status = solver.Solve(model)
+
+    if status == cp_model.UNKNOWN and _seed_usable(greedy, orders, allow_unassigned):
+        # Out of time before a first solution: the heuristic plan is valid
+        result = _build_split_result(orders, trucks, greedy, "FEASIBLE", engine)
+        result["fallback"] = True
+    elif status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        result = _empty_result(
+            orders, trucks, STATUS_NAMES.get(status, "UNKNOWN"), engine
+        )
+    else:
+        portions = {}
+        for (i, j), carried in portion.items():
+            value = solver.Value(carried)
+            if value:
+                portions.setdefault(i, {})[j] = value
+        result = _build_split_result(
+            orders, trucks, portions, STATUS_NAMES[status], engine
+        )
+        result["bound"] = solver.BestObjectiveBound() / weight
+
+    return _finish(result, {
+        "conflicts": solver.NumConflicts(),
+        "branches": solver.NumBranches(),
+    }, seed_objective)
+
+
+# Scheduler engines by name. Every engine takes the arguments of
+# ``cp_sat_schedule`` and returns the same result dict; ``register_engine``
+# adds more.
+ENGINES = {
+    "cp-sat": cp_sat_schedule,
+    "mip": mip_schedule,
+    "greedy": greedy_schedule,
+}
+
+
+def register_engine(name, fn):
+    ENGINES[name] = fn
+
+
+def choose_engine(orders, trucks, rules=None):
+    """Engine ``engine="auto"`` stands for on this instance size."""
+    size = len(orders) * len(trucks)
+    for limit, engine in rules or AUTO_ENGINE_RULES:
+        if limit is None or size <= limit:
+            return engine
+    return "cp-sat"
+
+
+def schedule_key(orders, trucks, daily_limit, allow_unassigned=False,
+                 previous=None, stability_weight=0, engine="cp-sat",
+                 products=None, max_splits=1, min_split=DEFAULT_MIN_SPLIT,
+                 time_limit=DEFAULT_TIME_LIMIT, workers=DEFAULT_WORKERS,
+                 seed=None, gap_limit=None):
+    """Cache key of a ``solve_schedule`` call."""
+    if engine == "auto":
+        engine = choose_engine(orders, trucks)
+    return fingerprint(
+        orders, trucks, daily_limit,
+        allow_unassigned=allow_unassigned,
+        previous=previous or {},
+        stability_weight=stability_weight,
+        engine=engine,
+        products=product_availability(products),
+        max_splits=max_splits,
+        min_split=min_split if max_splits > 1 else None,
+        time_limit=time_limit,
+        workers=workers,
+        seed=seed,
+        gap_limit=gap_limit,
+    )
+
+
+def solve_schedule(orders, trucks, daily_limit, allow_unassigned=False,
+                   previous=None, stability_weight=0, engine="cp-sat",
+                   products=None, max_splits=1, min_split=DEFAULT_MIN_SPLIT,
+                   monitor=None, use_cache=True, time_limit=DEFAULT_TIME_LIMIT,
+                   workers=DEFAULT_WORKERS, seed=None, gap_limit=None):
+    """
+    orders: list of dicts, each {'id': str, 'quantity': float, 'priority': int}
+        and an optional 'product' id
+    trucks: list of dicts, each {'id': str, 'capacity': float}
+    daily_limit: float
+    allow_unassigned: when True each order goes on *at most* one truck and the
+        daily limit only counts the selected orders, so overloaded days still
+        get a best-effort plan. When False every order must be served.
+    previous: optional {order_id: truck_id} from an earlier plan of these
+        same orders, fed to the solver as hints so re-solves start from it.
+        Library callers only: the API plans pending orders, which are on
+        no delivery yet.
+    stability_weight: objective bonus for each order kept on its previous
+        truck; 0 disables the stability objective.
+    engine: a name from ``ENGINES``: ``"cp-sat"`` or ``"mip"`` for the
+        exact solvers (both seeded with the greedy plan), ``"greedy"`` for
+        the first-fit-decreasing heuristic alone, or ``"auto"`` to pick one
+        by instance size (``AUTO_ENGINE_RULES``).
+    products: optional {product_id: {'capacity': float, 'stock': float}}.
+        The tonnes served of a product may not exceed its daily capacity
+        plus opening silo stock; products left out are unlimited.
+    max_splits: above 1, an order may be shared by up to this many trucks
+        (see ``split_schedule``); schedule entries then carry partial
+        tonnages in ``order_quantities`` and the result lists ``splits``.
+    min_split: smallest portion of a split order, in tons.
+    monitor: optional object notified while CP-SAT runs. ``on_start(stop)``
+        receives a callable that interrupts the search (safe from another
+        thread), ``on_solution(objective, bound, wall_time)`` is called
+        for every improving solution and ``on_bound(bound)`` whenever the
+        best bound moves.
+    use_cache: look the instance up in ``result_cache`` first and store
+        the result there afterwards.
+    time_limit: seconds the exact engines may search.
+    workers: solver threads (CP-SAT search workers); 0 keeps the default.
+    seed: random seed; set it to get the same plan for the same inputs.
+    gap_limit: stop once the plan is within this relative gap of the
+        bound (0.01 = 1%), instead of spending the whole time limit.
+
+    Returns a dict with the per-truck ``schedule`` (each entry has its
+    ``orders``, ``load`` and the tonnes per order in ``order_quantities``),
+    the ``unassigned`` order ids, the solver ``status``, the ``objective``
+    (total priority served) and the ``engine`` that produced it. Results of
+    the exact engines (CP-SAT and MIP, split orders or not) also carry the
+    greedy ``heuristic_objective``, the relative ``gap`` between the two
+    and the solver's best ``bound``. When the time limit runs out before
+    the solver finds any plan, the greedy plan is returned with
+    ``fallback`` set.
+
+    Results are cached under a fingerprint of the inputs and options
+    (``use_cache=False`` bypasses it); ``cached`` tells whether the result
+    was served from the cache and ``cache_key`` is its key there. Every run
+    that is not served from the cache is recorded by
+    ``telemetry.record_run``, with the search effort the exact engines
+    report in ``solver_stats`` (conflicts, branches).
+    """
+    if engine == "auto":
+        engine = choose_engine(orders, trucks)
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown scheduler engine: {engine}")
+
+    if use_cache:
+        key = schedule_key(
+            orders, trucks, daily_limit, allow_unassigned,
+            previous, stability_weight, engine, products,
+            max_splits, min_split, time_limit, workers, seed, gap_limit,
+        )
+        cached = result_cache.get(key)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+
+    started = time.perf_counter()
+    if max_splits > 1:
+        result = split_schedule(
+            orders, trucks, daily_limit, allow_unassigned,
+            previous=previous, stability_weight=stability_weight,
+            engine=engine, products=products, min_split=min_split,
+            max_splits=max_splits, monitor=monitor, time_limit=time_limit,
+            workers=workers, seed=seed, gap_limit=gap_limit,
+        )
+    else:
+        result = ENGINES[engine](
+            orders, trucks, daily_limit, allow_unassigned,
+            previous=previous, stability_weight=stability_weight,
+            products=products, monitor=monitor, time_limit=time_limit,
+            workers=workers, seed=seed, gap_limit=gap_limit,
+        )
+
+    record_run(orders, trucks, {
+        "engine": engine,
+        "allow_unassigned": allow_unassigned,
+        "stability_weight": stability_weight,
+        "max_splits": max_splits,
+        "min_split": min_split,
+        "products": len(product_availability(products)),
+        "time_limit": time_limit,
+        "workers": workers,
+        "seed": seed,
+        "gap_limit": gap_limit,
+    }, result, time.perf_counter() - started)
+
+    # An interrupted search is not the answer for these inputs
+    if use_cache and not getattr(monitor, "cancelled", False):
+        result["cache_key"] = key
+        result_cache.put(key, result)
+    result["cached"] = False
     return result
+
+
+def optimize_schedule(orders, trucks, daily_limit, allow_unassigned=False,
+                      previous=None, stability_weight=0, engine="cp-sat",
+                      products=None, max_splits=1, min_split=DEFAULT_MIN_SPLIT,
+                      monitor=None, **solver_options):
+    """Return only the per-truck schedule list (see ``solve_schedule``)."""
+    result = solve_schedule(
+        orders, trucks, daily_limit, allow_unassigned,
+        previous=previous, stability_weight=stability_weight, engine=engine,
+        products=products, max_splits=max_splits, min_split=min_split,
+        monitor=monitor, **solver_options
+    )
+    if result["objective"] is None:
+        return []
+    return result["schedule"]
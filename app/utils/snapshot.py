@@ -0,0 +1,362 @@
+# app/utils/snapshot.py
+import logging
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import event, select
+
+from app.models import Delivery, DeliveryOrder, Order, Truck
+
+# Where a session collects what its writes touched until commit or rollback
+DIRTY = "snapshot_dirty"
+PENDING = "snapshot_pending"
+# Tables whose bulk statements cannot be traced row by row
+TRACKED_TABLES = {"deliveries", "delivery_orders", "orders", "trucks"}
+
+
+class ScheduleSnapshot:
+    """The planned schedule, kept up to date as deliveries are written.
+
+    Holds each active delivery's truck, date and order quantities, the
+    pending orders and the fleet, with per-truck and per-truck-per-day
+    loads maintained as those change. ``track`` hooks it to the session:
+    what a transaction writes is re-read inside that transaction just
+    before it commits and applied once it has committed, so the snapshot
+    never shows rolled back writes. Reads cost no query.
+
+    Writes made outside this process, or through plain SQL, are not seen:
+    ``check`` rebuilds from the tables, reports the drift and is run
+    every ``interval`` seconds once ``start_checker`` is called.
+    """
+
+    def __init__(self, active_statuses, pending_status="en attente"):
+        self.active_statuses = list(active_statuses)
+        self.pending_status = pending_status
+        self.built = False
+        self._lock = threading.RLock()
+        self._checker = None
+        self._reset()
+
+    def _reset(self):
+        self.trucks = {}  # truck id -> {'plate_number', 'capacity'}
+        self.deliveries = {}  # delivery id -> contribution (see _contribution)
+        self.pending = {}  # order id -> quantity, orders waiting for a truck
+        self.by_truck = {}  # truck key -> {delivery id: contribution}
+        self.loads = Counter()  # (truck key, date) -> tonnes
+        self.order_refs = Counter()  # order id -> active deliveries carrying it
+        self.scheduled_quantity = 0.0
+
+    # Reading the tables
+
+    def _contribution(self, row, links, legacy_quantities):
+        """What an active delivery adds to the schedule, or None."""
+        if row.status not in self.active_statuses:
+            return None
+        if row.truck_id is not None:
+            key = str(row.truck_id)
+        elif row.is_external:
+            key = f"ext:{row.external_truck_label or 'Externe'}"
+        else:
+            return None
+        orders = [(str(order_id), quantity) for order_id, quantity in links]
+        # Legacy single order_id if not already represented in order_links
+        if row.order_id and str(row.order_id) not in {oid for oid, _ in orders}:
+            orders.append(
+                (str(row.order_id), legacy_quantities.get(str(row.order_id), 0))
+            )
+        return {
+            "truck": key,
+            "date": row.scheduled_date.isoformat() if row.scheduled_date else None,
+            "orders": orders,
+        }
+
+    def read(self, connection, delivery_ids=None, order_ids=None, truck_ids=None):
+        """Current rows as ``(deliveries, pending, trucks)`` changes.
+
+        Every argument left as None reads the whole table; otherwise only
+        those ids (UUIDs) are read and ids without a row (or no longer
+        active or pending) map to None, meaning "remove".
+        """
+        query = select(
+            Delivery.id, Delivery.truck_id, Delivery.is_external,
+            Delivery.external_truck_label, Delivery.scheduled_date,
+            Delivery.order_id, Delivery.status,
+        )
+        if delivery_ids is None:
+            query = query.where(Delivery.status.in_(self.active_statuses))
+        else:
+            query = query.where(Delivery.id.in_(delivery_ids))
+        rows = connection.execute(query).all()
+
+        links = {}
+        if rows:
+            link_query = select(
+                DeliveryOrder.delivery_id, DeliveryOrder.order_id, DeliveryOrder.quantity
+            )
+            if delivery_ids is not None:
+                link_query = link_query.where(DeliveryOrder.delivery_id.in_(delivery_ids))
+            for delivery_id, order_id, quantity in connection.execute(link_query):
+                links.setdefault(delivery_id, []).append((order_id, quantity))
+
+        legacy_ids = {row.order_id for row in rows if row.order_id}
+        legacy_quantities = {
+            str(order_id): quantity for order_id, quantity in connection.execute(
+                select(Order.id, Order.quantity).where(Order.id.in_(legacy_ids))
+            )
+        } if legacy_ids else {}
+
+        deliveries = {str(delivery_id): None for delivery_id in delivery_ids or ()}
+        for row in rows:
+            deliveries[str(row.id)] = self._contribution(
+                row, links.get(row.id, []), legacy_quantities
+            )
+
+        pending_query = select(Order.id, Order.quantity).where(
+            Order.status == self.pending_status
+        )
+        if order_ids is not None:
+            pending_query = pending_query.where(Order.id.in_(order_ids))
+        pending = {str(order_id): None for order_id in order_ids or ()}
+        if order_ids is None or order_ids:
+            pending.update(
+                (str(order_id), quantity)
+                for order_id, quantity in connection.execute(pending_query)
+            )
+
+        truck_query = select(Truck.id, Truck.plate_number, Truck.capacity)
+        if truck_ids is not None:
+            truck_query = truck_query.where(Truck.id.in_(truck_ids))
+        trucks = {str(truck_id): None for truck_id in truck_ids or ()}
+        if truck_ids is None or truck_ids:
+            trucks.update(
+                (str(truck_id), {"plate_number": plate, "capacity": capacity})
+                for truck_id, plate, capacity in connection.execute(truck_query)
+            )
+        return deliveries, pending, trucks
+
+    # Maintaining the aggregates
+
+    def _add(self, delivery_id, contribution, sign):
+        key = contribution["truck"]
+        tonnes = sum(quantity or 0 for _, quantity in contribution["orders"])
+        if sign > 0:
+            self.by_truck.setdefault(key, {})[delivery_id] = contribution
+        else:
+            self.by_truck.get(key, {}).pop(delivery_id, None)
+            if not self.by_truck.get(key):
+                self.by_truck.pop(key, None)
+        self.loads[(key, contribution["date"])] += sign * tonnes
+        if abs(self.loads[(key, contribution["date"])]) < 1e-9:
+            del self.loads[(key, contribution["date"])]
+        for order_id, _ in contribution["orders"]:
+            self.order_refs[order_id] += sign
+            if self.order_refs[order_id] <= 0:
+                del self.order_refs[order_id]
+        self.scheduled_quantity += sign * tonnes
+
+    def apply(self, deliveries, pending, trucks):
+        """Fold changes read by ``read`` into the snapshot."""
+        with self._lock:
+            for delivery_id, contribution in deliveries.items():
+                old = self.deliveries.pop(delivery_id, None)
+                if old is not None:
+                    self._add(delivery_id, old, -1)
+                if contribution is not None:
+                    self.deliveries[delivery_id] = contribution
+                    self._add(delivery_id, contribution, 1)
+            for order_id, quantity in pending.items():
+                if quantity is None:
+                    self.pending.pop(order_id, None)
+                else:
+                    self.pending[order_id] = quantity
+            for truck_id, info in trucks.items():
+                if info is None:
+                    self.trucks.pop(truck_id, None)
+                else:
+                    self.trucks[truck_id] = info
+
+    def rebuild(self, connection):
+        """Replace the whole snapshot with what the tables hold."""
+        changes = self.read(connection)
+        with self._lock:
+            self._reset()
+            self.apply(*changes)
+            self.built = True
+
+    # Consistency
+
+    def check(self, connection):
+        """Rebuild from scratch and report how far the snapshot had drifted.
+
+        Returns ``{'drift': bool, 'deliveries', 'pending', 'trucks'}`` with
+        the ids whose maintained and rebuilt values differed.
+        """
+        deliveries, pending, trucks = self.read(connection)
+        with self._lock:
+            def differing(maintained, rebuilt):
+                return sorted(
+                    key for key in set(maintained) | set(rebuilt)
+                    if maintained.get(key) != rebuilt.get(key)
+                )
+
+            report = {
+                "deliveries": differing(self.deliveries, deliveries),
+                "pending": differing(self.pending, pending),
+                "trucks": differing(self.trucks, trucks),
+            } if self.built else {"deliveries": [], "pending": [], "trucks": []}
+            report["drift"] = any(report.values())
+            self._reset()
+            self.apply(deliveries, pending, trucks)
+            self.built = True
+        if report["drift"]:
+            logging.warning(
+                "Schedule snapshot drifted: %d deliveries, %d pending orders, "
+                "%d trucks differed from the tables",
+                len(report["deliveries"]), len(report["pending"]), len(report["trucks"]),
+            )
+        return report
+
+    def start_checker(self, app, session, interval):
+        """Run ``check`` every ``interval`` seconds in a daemon thread."""
+        with self._lock:
+            if self._checker is not None or not interval:
+                return
+
+            def run():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        with app.app_context():
+                            self.check(session.connection())
+                            session.remove()
+                    except Exception:
+                        logging.exception("Schedule snapshot check failed")
+
+            self._checker = threading.Thread(
+                target=run, name="schedule-snapshot-check", daemon=True
+            )
+            self._checker.start()
+
+    # Output
+
+    def schedule(self):
+        """Per-truck schedule entries and totals, like ``get_schedule``'s."""
+        with self._lock:
+            entries = {
+                truck_id: {
+                    "truck": info["plate_number"],
+                    "orders": [],
+                    "load": 0,
+                    "days": {},
+                    "is_external": False,
+                }
+                for truck_id, info in self.trucks.items()
+            }
+            for key, deliveries in self.by_truck.items():
+                entry = entries.get(key)
+                if entry is None:
+                    if not key.startswith("ext:"):
+                        continue  # its truck was deleted
+                    entry = entries[key] = {
+                        "truck": key[len("ext:"):],
+                        "orders": [],
+                        "load": 0,
+                        "days": {},
+                        "is_external": True,
+                    }
+                for contribution in deliveries.values():
+                    entry["orders"].extend(
+                        {"id": order_id, "quantity": quantity}
+                        for order_id, quantity in contribution["orders"]
+                    )
+            for (key, day), tonnes in self.loads.items():
+                if key in entries:
+                    entries[key]["load"] += tonnes
+                    entries[key]["days"][day] = tonnes
+            totals = {
+                "scheduled_orders": len(self.order_refs),
+                "scheduled_quantity": self.scheduled_quantity,
+                "pending_orders": len(self.pending),
+                "pending_quantity": sum(self.pending.values()),
+                "total_trucks": len(self.trucks),
+                "total_capacity": sum(
+                    info["capacity"] or 0 for info in self.trucks.values()
+                ),
+            }
+        return list(entries.values()), totals
+
+
+def track(session, snapshot):
+    """Keep ``snapshot`` in step with what ``session`` commits."""
+    if event.contains(session, "after_flush", _collect):
+        return
+
+    event.listen(session, "after_flush", _collect)
+    event.listen(session, "do_orm_execute", _collect_bulk)
+
+    @event.listens_for(session, "before_commit")
+    def read_changes(s):
+        # Flush first so the reads below see this transaction's writes
+        s.flush()
+        dirty = s.info.pop(DIRTY, None)
+        if not dirty or not snapshot.built:
+            return
+        connection = s.connection()
+        if dirty.get("rebuild"):
+            s.info[PENDING] = ("rebuild", snapshot.read(connection))
+            return
+        order_ids = dirty["orders"]
+        delivery_ids = set(dirty["deliveries"])
+        if order_ids:
+            # Legacy deliveries show their order's current quantity
+            delivery_ids |= set(connection.execute(
+                select(Delivery.id).where(Delivery.order_id.in_(order_ids))
+            ).scalars())
+        s.info[PENDING] = ("apply", snapshot.read(
+            connection, delivery_ids, order_ids, dirty["trucks"]
+        ))
+
+    @event.listens_for(session, "after_commit")
+    def apply_changes(s):
+        pending = s.info.pop(PENDING, None)
+        if pending is None:
+            return
+        mode, changes = pending
+        if mode == "rebuild":
+            with snapshot._lock:
+                snapshot._reset()
+                snapshot.apply(*changes)
+        else:
+            snapshot.apply(*changes)
+
+    @event.listens_for(session, "after_soft_rollback")
+    def forget(s, previous_transaction):
+        s.info.pop(DIRTY, None)
+        s.info.pop(PENDING, None)
+
+
+def _dirty(session):
+    return session.info.setdefault(
+        DIRTY, {"deliveries": set(), "orders": set(), "trucks": set()}
+    )
+
+
+def _collect(session, flush_context):
+    dirty = _dirty(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Delivery):
+            dirty["deliveries"].add(obj.id)
+        elif isinstance(obj, DeliveryOrder):
+            dirty["deliveries"].add(obj.delivery_id)
+        elif isinstance(obj, Order):
+            dirty["orders"].add(obj.id)
+        elif isinstance(obj, Truck):
+            dirty["trucks"].add(obj.id)
+
+
+def _collect_bulk(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if table is not None and table.name in TRACKED_TABLES:
+            _dirty(state.session)["rebuild"] = True
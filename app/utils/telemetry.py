@@ -0,0 +1,166 @@
+# app/utils/telemetry.py
+import json
+import logging
+import math
+import os
+import time
+
+# Append-only JSON lines file, one line per solver run; set the variable to
+# an empty string to switch recording off. An environment variable rather
+# than app config because solves also run in worker processes.
+TELEMETRY_FILE = os.environ.get("SOLVER_TELEMETRY_FILE", "solver_runs.jsonl")
+# Past this size the file is moved to "<file>.1" (replacing the previous
+# one) and a new one started; 0 never rotates
+TELEMETRY_MAX_BYTES = int(
+    os.environ.get("SOLVER_TELEMETRY_MAX_BYTES", 50 * 1024 * 1024)
+)
+# Bytes read at a time when reading the file from its end
+READ_BLOCK = 64 * 1024
+PERCENTILES = (50, 90, 95, 99)
+# A run that used this share of its time limit was cut off by it
+TIME_LIMIT_SHARE = 0.95
+
+
+def record_run(orders, trucks, params, result, wall_time, mode="assignment",
+               path=None):
+    """Append one solver run to the telemetry file.
+
+    params: the options the solver ran with (engine, time_limit, ...)
+    mode: the kind of plan, ``assignment`` or timed ``trips``
+    result: the solver result; its ``solver_stats`` (conflicts, branches)
+        are copied when the engine reports them
+
+    Failures to write are logged, never raised: telemetry must not break
+    planning.
+    """
+    path = TELEMETRY_FILE if path is None else path
+    if not path:
+        return
+    stats = result.get("solver_stats") or {}
+    run = {
+        "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "orders": len(orders),
+        "trucks": len(trucks),
+        "mode": mode,
+        "engine": result.get("engine"),
+        "params": params,
+        "status": result.get("status"),
+        "objective": result.get("objective"),
+        "bound": result.get("bound"),
+        "fallback": bool(result.get("fallback")),
+        "wall_time": wall_time,
+        "conflicts": stats.get("conflicts"),
+        "branches": stats.get("branches"),
+    }
+    try:
+        if TELEMETRY_MAX_BYTES and os.path.getsize(path) >= TELEMETRY_MAX_BYTES:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass  # not written yet, or just rotated by another process
+    try:
+        # One write per line so runs from several processes do not interleave
+        with open(path, "a") as f:
+            f.write(json.dumps(run, default=str) + "\n")
+    except OSError:
+        logging.warning("Could not record solver run in %s", path, exc_info=True)
+
+
+def _lines_backwards(path):
+    """The lines of ``path``, last first, read a block at a time."""
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0:
+            size = min(READ_BLOCK, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + tail).split(b"\n")
+            tail = lines.pop(0)
+            yield from reversed(lines)
+        yield tail
+
+
+def load_runs(path=None, engine=None, since=None, limit=None):
+    """Recorded runs, oldest first.
+
+    engine: keep only this engine's runs
+    since: keep runs at or after this "YYYY-MM-DD[THH:MM:SS]" timestamp
+    limit: keep only the latest ``limit`` matching runs
+
+    The file (then its rotated predecessor) is read from the end and
+    reading stops at ``limit`` runs or at the first run before ``since``,
+    so a bounded query costs the same however long the history is.
+    """
+    path = TELEMETRY_FILE if path is None else path
+    if not path or (limit is not None and limit <= 0):
+        return []
+    runs = []
+    for name in (path, path + ".1"):
+        if not os.path.exists(name):
+            continue
+        for line in _lines_backwards(name):
+            try:
+                run = json.loads(line)
+            except ValueError:
+                continue  # blank, or a line cut short by a crash
+            if since and run.get("at", "") < since:
+                return runs[::-1]  # runs are appended in time order
+            if engine and run.get("engine") != engine:
+                continue
+            runs.append(run)
+            if limit is not None and len(runs) >= limit:
+                return runs[::-1]
+    return runs[::-1]
+
+
+def percentile(values, q):
+    """The ``q``-th percentile of ``values``, interpolating between ranks."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize_runs(runs, percentiles=PERCENTILES):
+    """Counts and percentiles of wall time, instance size and search effort
+    per engine (timed ``trips`` runs apart, as "cp-sat (trips)").
+
+    ``at_time_limit`` counts the runs stopped by their time limit rather
+    than by proving optimality: as it grows, plans are being cut short.
+    """
+    by_engine = {}
+    for run in runs:
+        key = run.get("engine")
+        if run.get("mode", "assignment") != "assignment":
+            key = f"{key} ({run['mode']})"
+        by_engine.setdefault(key, []).append(run)
+
+    summary = {}
+    for engine, engine_runs in by_engine.items():
+        statuses = {}
+        for run in engine_runs:
+            statuses[run["status"]] = statuses.get(run["status"], 0) + 1
+
+        def spread(field):
+            values = [r[field] for r in engine_runs if r.get(field) is not None]
+            return {f"p{q}": percentile(values, q) for q in percentiles} | {
+                "max": max(values) if values else None
+            }
+
+        summary[engine] = {
+            "runs": len(engine_runs),
+            "statuses": statuses,
+            "fallbacks": sum(1 for r in engine_runs if r.get("fallback")),
+            "at_time_limit": sum(
+                1 for r in engine_runs
+                if (r.get("params") or {}).get("time_limit")
+                and r["wall_time"] >= TIME_LIMIT_SHARE * r["params"]["time_limit"]
+            ),
+            "wall_time": spread("wall_time"),
+            "orders": spread("orders"),
+            "conflicts": spread("conflicts"),
+            "branches": spread("branches"),
+        }
+    return summary
@@ -0,0 +1,329 @@
+# app/utils/timetable.py
+import math
+import time
+from datetime import date as date_type, datetime
+
+from ortools.sat.python import cp_model
+
+from app.utils.scheduler import (
+    DEFAULT_TIME_LIMIT,
+    DEFAULT_WORKERS,
+    SCALE,
+    STATUS_NAMES,
+    ProgressCallback,
+    configure_solver,
+    product_availability,
+)
+from app.utils.telemetry import record_run
+
+DEFAULT_TURNAROUND = 120  # minutes for load, drive, unload and return
+DEFAULT_WINDOW = 60  # minutes either side of the requested time
+DEFAULT_DAY_START = "06:00"
+DEFAULT_DAY_END = "20:00"
+
+
+def _minutes(value):
+    """Minutes since midnight for a ``time``, ``datetime`` or "HH:MM[:SS]"."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.strptime(value[:5], "%H:%M").time()
+    return value.hour * 60 + value.minute
+
+
+def _clock(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _date_str(value):
+    if isinstance(value, date_type):
+        return value.isoformat()
+    return value
+
+
+def loading_minutes(quantity, rate):
+    """Minutes a bay is busy loading ``quantity`` tonnes at ``rate`` t/h."""
+    return max(1, math.ceil(quantity * 60 / rate))
+
+
+def bay_capacity(bays, rate, day_start=DEFAULT_DAY_START, day_end=DEFAULT_DAY_END):
+    """Tonnes the loading bays can put on trucks over the working day.
+
+    Returns None when the bays are not modelled (no count or rate).
+    """
+    if not bays or not rate:
+        return None
+    hours = (_minutes(day_end) - _minutes(day_start)) / 60
+    return bays * rate * hours
+
+
+def schedule_trips(orders, trucks, daily_limit, allow_unassigned=True,
+                   turnaround=DEFAULT_TURNAROUND, window=DEFAULT_WINDOW,
+                   day_start=DEFAULT_DAY_START, day_end=DEFAULT_DAY_END,
+                   bays=None, bay_rate=None, products=None, day=None,
+                   monitor=None, time_limit=DEFAULT_TIME_LIMIT,
+                   workers=DEFAULT_WORKERS, seed=None, gap_limit=None):
+    """Plan one day as timed truck trips.
+
+    orders: list of dicts {'id', 'quantity', 'priority', 'time'} where
+        'time' is the requested time (``time`` or "HH:MM", None = any time)
+        and an optional 'date' gives the day
+    trucks: list of dicts {'id', 'capacity'}, optionally 'turnaround'
+        (minutes) to override the default for that truck
+    daily_limit: tonnes that can leave the plant that day
+    turnaround: minutes a truck is busy per trip
+    window: a trip may start up to this many minutes before or after the
+        requested time
+    day_start, day_end: working hours every trip must fit in
+    bays, bay_rate: number of loading bays and tonnes per hour each one
+        loads; when both are given, loading is a cumulative resource so no
+        more than ``bays`` trucks load at once
+    products: optional per-product capacity and stock (see
+        ``solve_schedule``)
+    time_limit, workers, seed, gap_limit: CP-SAT search budget (see
+        ``solve_schedule``)
+
+    Each served order is one trip: an optional interval on the chosen truck,
+    and the trips of a truck may not overlap, so a truck can do several
+    round trips a day. A trip starts with its loading at the plant, so
+    with bays modelled departures are spread instead of queueing. The
+    objective is total priority served, then the smallest total deviation
+    from the requested times.
+
+    Returns the same keys as ``solve_schedule`` (``schedule`` aggregates the
+    tonnes each truck carries over the day) plus ``trips``: one entry per
+    served order with its truck, ``scheduled_date`` and ``scheduled_time``.
+    """
+    model = cp_model.CpModel()
+
+    open_at = _minutes(day_start)
+    close_at = _minutes(day_end)
+    daily_limit_int = int(round(daily_limit * SCALE))
+    for o in orders:
+        o['quantity_int'] = int(round(o['quantity'] * SCALE))
+    for t in trucks:
+        t['capacity_int'] = int(round((t.get('capacity') or 0) * SCALE))
+    durations = [t.get('turnaround') or turnaround for t in trucks]
+
+    # Decision vars: start[i] = departure of order i (minutes since midnight),
+    # x[i,j] = 1 if order i is a trip of truck j
+    start = {}
+    deviation = {}
+    x = {}
+    intervals = {j: [] for j in range(len(trucks))}
+    for i, order in enumerate(orders):
+        requested = _minutes(order.get('time'))
+        if requested is None:
+            low, high = open_at, close_at
+        else:
+            low, high = requested - window, requested + window
+        low = max(low, open_at)
+        high = min(high, close_at)
+
+        candidates = [
+            j for j, t in enumerate(trucks)
+            if order['quantity_int'] <= t['capacity_int']
+            and low + durations[j] <= close_at
+        ]
+        if not candidates or low > high:
+            continue
+
+        start[i] = model.NewIntVar(low, high, f"start_o{i}")
+        if requested is not None:
+            deviation[i] = model.NewIntVar(0, 24 * 60, f"dev_o{i}")
+            model.AddAbsEquality(deviation[i], start[i] - requested)
+
+        for j in candidates:
+            x[(i,j)] = model.NewBoolVar(f"x_o{i}_t{j}")
+            # The trip must be back before closing time
+            model.Add(start[i] + durations[j] <= close_at).OnlyEnforceIf(x[(i,j)])
+            intervals[j].append(model.NewOptionalFixedSizeIntervalVar(
+                start[i], durations[j], x[(i,j)], f"trip_o{i}_t{j}"
+            ))
+
+    # 1) Each order is at most (exactly, in strict mode) one trip
+    is_served = {}
+    for i in range(len(orders)):
+        served = [x[(i,j)] for j in range(len(trucks)) if (i,j) in x]
+        if allow_unassigned:
+            model.Add(sum(served) <= 1)
+        else:
+            model.Add(sum(served) == 1)
+        if served:
+            is_served[i] = model.NewBoolVar(f"served_o{i}")
+            model.Add(sum(served) == is_served[i])
+
+    # 2) A truck's trips never overlap (capacity is per trip, checked above)
+    for j in range(len(trucks)):
+        model.AddNoOverlap(intervals[j])
+
+    # 2b) Loading bays: each trip occupies one bay while it loads, and at
+    #     most ``bays`` loadings may overlap at any time
+    loading = {}
+    if bays and bay_rate:
+        for i, served in is_served.items():
+            loading[i] = loading_minutes(orders[i]['quantity'], bay_rate)
+            model.Add(start[i] + loading[i] <= close_at).OnlyEnforceIf(served)
+        model.AddCumulative(
+            [
+                model.NewOptionalFixedSizeIntervalVar(
+                    start[i], loading[i], is_served[i], f"load_o{i}"
+                )
+                for i in loading
+            ],
+            [1] * len(loading),
+            bays,
+        )
+
+    # 3) Don’t exceed daily production limit
+    model.Add(
+        sum(var * orders[i]['quantity_int'] for (i, j), var in x.items())
+        <= daily_limit_int
+    )
+
+    # 3b) Per product, no more than the day's production plus silo stock
+    for product_id, tonnes in product_availability(products).items():
+        shipped = [
+            var * orders[i]['quantity_int'] for (i, j), var in x.items()
+            if orders[i].get('product') == product_id
+        ]
+        if shipped:
+            model.Add(sum(shipped) <= int(round(tonnes * SCALE)))
+
+    # 4) Maximize total priority served, then stay close to requested times
+    weight = 24 * 60 * max(len(deviation), 1) + 1
+    model.Maximize(
+        weight * sum(orders[i].get('priority', 1) * var for (i, j), var in x.items())
+        - sum(deviation.values())
+    )
+
+    # Solve
+    started = time.perf_counter()
+    solver = cp_model.CpSolver()
+    configure_solver(solver, time_limit, workers, seed, gap_limit)
+    if monitor is not None:
+        monitor.on_start(solver.StopSearch)
+        solver.best_bound_callback = lambda bound: monitor.on_bound(bound / weight)
+        status = solver.Solve(model, ProgressCallback(monitor, weight))
+    else:
+        status = solver.Solve(model)
+    wall_time = time.perf_counter() - started
+    run_params = {
+        "allow_unassigned": allow_unassigned,
+        "bays": bays,
+        "products": len(product_availability(products)),
+        "time_limit": time_limit,
+        "workers": workers,
+        "seed": seed,
+        "gap_limit": gap_limit,
+    }
+
+    result = {
+        "engine": "cp-sat",
+        "status": STATUS_NAMES.get(status, "UNKNOWN"),
+        "objective": None,
+        "schedule": [],
+        "trips": [],
+        "unassigned": [],
+        "solver_stats": {
+            "conflicts": solver.NumConflicts(),
+            "branches": solver.NumBranches(),
+        },
+    }
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        result["schedule"] = [
+            {
+                "truck": t["id"],
+                "orders": [],
+                "load": 0.0,
+                "order_quantities": {},
+                "trips": 0,
+            }
+            for t in trucks
+        ]
+        result["unassigned"] = [o["id"] for o in orders]
+        record_run(orders, trucks, run_params, result, wall_time, mode="trips")
+        return result
+
+    per_truck = {j: [] for j in range(len(trucks))}
+    served = set()
+    for (i, j), var in x.items():
+        if solver.Value(var):
+            per_truck[j].append(i)
+            served.add(i)
+
+    for j, truck in enumerate(trucks):
+        trips = sorted(per_truck[j], key=lambda i: solver.Value(start[i]))
+        for i in trips:
+            departure = solver.Value(start[i])
+            result["trips"].append({
+                "truck": truck["id"],
+                "order": orders[i]["id"],
+                "quantity": orders[i]["quantity_int"] / SCALE,
+                "scheduled_date": _date_str(orders[i].get("date", day)),
+                "scheduled_time": _clock(departure),
+                "return_time": _clock(departure + durations[j]),
+                "loading_minutes": loading.get(i),
+            })
+        result["schedule"].append({
+            "truck": truck["id"],
+            "orders": [orders[i]["id"] for i in trips],
+            "load": sum(orders[i]["quantity_int"] for i in trips) / SCALE,
+            "order_quantities": {
+                orders[i]["id"]: orders[i]["quantity_int"] / SCALE for i in trips
+            },
+            "trips": len(trips),
+        })
+
+    result["objective"] = sum(orders[i].get('priority', 1) for i in served)
+    result["bound"] = solver.BestObjectiveBound() / weight
+    result["unassigned"] = [
+        o["id"] for i, o in enumerate(orders) if i not in served
+    ]
+    record_run(orders, trucks, run_params, result, wall_time, mode="trips")
+    return result
+
+
+def plan_trips(orders, trucks, daily_limit, monitor=None, **options):
+    """Run ``schedule_trips`` for each requested date and merge the days.
+
+    The whole fleet and ``daily_limit`` are available on every date, as is
+    each product's capacity; its opening stock counts on the first date only.
+    """
+    by_date = {}
+    for order in orders:
+        by_date.setdefault(_date_str(order.get("date")), []).append(order)
+
+    merged = {
+        "engine": "cp-sat",
+        "status": "OPTIMAL",
+        "objective": 0,
+        "schedule": [],
+        "trips": [],
+        "unassigned": [],
+    }
+    products = options.pop("products", None)
+    for day, day_orders in sorted(by_date.items(), key=lambda item: str(item[0])):
+        if getattr(monitor, "cancelled", False):
+            merged["status"] = "UNKNOWN"
+            merged["unassigned"].extend(o["id"] for o in day_orders)
+            continue
+        result = schedule_trips(
+            day_orders, trucks, daily_limit, products=products, day=day,
+            monitor=monitor, **options
+        )
+        if products:
+            products = {
+                product_id: dict(supply, stock=None)
+                for product_id, supply in products.items()
+            }
+        if monitor is not None:
+            monitor.on_part(result)
+        for entry in result["schedule"]:
+            merged["schedule"].append(dict(entry, date=day))
+        merged["trips"].extend(result["trips"])
+        merged["unassigned"].extend(result["unassigned"])
+        merged["objective"] += result["objective"] or 0
+        if result["status"] != "OPTIMAL" and merged["status"] == "OPTIMAL":
+            merged["status"] = result["status"]
+    return merged
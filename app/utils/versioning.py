@@ -0,0 +1,125 @@
+# app/utils/versioning.py
+import functools
+import hashlib
+import threading
+import time
+import uuid
+from email.utils import formatdate
+
+from flask import request
+from sqlalchemy import event
+
+# Where a session collects the tables it wrote until commit or rollback
+CHANGED_TABLES = "changed_tables"
+
+
+class TableVersions:
+    """Per-table write counters for conditional GETs.
+
+    Every committed write to a table bumps its counter, so an ETag built
+    from the counters of the tables a response reads changes exactly when
+    the response may have. The counters live in this process: ETags carry
+    a token of the process so another worker (or a restart) never answers
+    304 to an ETag it did not issue, and writes made outside this process
+    (other workers, scripts) are only seen after a restart. That holds for
+    the single-process server ``run.py`` starts.
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:8]
+        self._versions = {}
+        self._modified = {}
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def bump(self, tables):
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                self._modified[table] = now
+
+    def etag(self, tables, extra=""):
+        with self._lock:
+            state = ",".join(f"{t}:{self._versions.get(t, 0)}" for t in tables)
+        digest = hashlib.sha1(f"{state}|{extra}".encode("utf-8")).hexdigest()[:16]
+        return f"{self.token}-{digest}"
+
+    def last_modified(self, tables):
+        with self._lock:
+            return max(
+                [self._modified.get(t, self._started) for t in tables],
+                default=self._started,
+            )
+
+
+table_versions = TableVersions()
+
+
+def track_writes(session, versions=table_versions):
+    """Bump ``versions`` for the tables ``session`` writes, once committed.
+
+    Flushed ORM objects and ORM-enabled bulk INSERT/UPDATE/DELETE
+    statements (``session.execute(insert(Model), rows)``) are both seen;
+    plain SQL text is not.
+    """
+    if event.contains(session, "after_flush", _collect_flushed):
+        return
+
+    event.listen(session, "after_flush", _collect_flushed)
+    event.listen(session, "do_orm_execute", _collect_executed)
+
+    @event.listens_for(session, "after_commit")
+    def bump_committed(s):
+        tables = s.info.pop(CHANGED_TABLES, None)
+        if tables:
+            versions.bump(tables)
+
+    @event.listens_for(session, "after_soft_rollback")
+    def forget_rolled_back(s, previous_transaction):
+        s.info.pop(CHANGED_TABLES, None)
+
+
+def _collect_flushed(session, flush_context):
+    tables = session.info.setdefault(CHANGED_TABLES, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            tables.add(table.name)
+
+
+def _collect_executed(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, "table", None)
+        if table is not None:
+            state.session.info.setdefault(CHANGED_TABLES, set()).add(table.name)
+
+
+def conditional(*tables, versions=table_versions):
+    """Serve a GET view with an ETag derived from ``tables``' versions.
+
+    A request whose ``If-None-Match`` matches the current ETag gets a 304
+    without the view running, so without touching the database. The query
+    string is part of the ETag since it changes the response.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            etag = versions.etag(tables, request.query_string.decode("utf-8"))
+            last_modified = formatdate(versions.last_modified(tables), usegmt=True)
+            if request.if_none_match.contains_weak(etag):
+                return "", 304, {"ETag": f'"{etag}"', "Last-Modified": last_modified}
+
+            response = view(*args, **kwargs)
+            if isinstance(response, tuple):
+                body, status = response[0], response[1]
+            else:
+                body, status = response, 200
+            if status == 200 and not isinstance(body, str):
+                body.set_etag(etag)
+                body.headers["Last-Modified"] = last_modified
+            return response
+        return wrapper
+    return decorator
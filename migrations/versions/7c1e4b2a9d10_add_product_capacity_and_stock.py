@@ -0,0 +1,26 @@
+"""Add product daily capacity and stock
+
+Revision ID: 7c1e4b2a9d10
+Revises: 340b50a81e9b
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4b2a9d10'
+down_revision = '340b50a81e9b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.add_column(sa.Column('daily_capacity', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('stock', sa.Float(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('stock')
+        batch_op.drop_column('daily_capacity')